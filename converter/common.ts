@@ -19,9 +19,11 @@ try {
 
 const workingContentPath = path.join(CWD, 'working', 'content')
 const workingTranslationsPath = path.join(CWD, 'working', 'translations')
+const workingCachePath = path.join(CWD, 'working', 'cache')
 
 export {
   translationsLanguages,
+  workingCachePath,
   workingContentPath,
   workingTranslationsPath
 }
@@ -1,10 +1,12 @@
 import { spawn } from 'child_process'
 import * as path from 'path'
+import * as readline from 'readline'
 
 import * as fs from 'fs-extra'
 
 import {
   translationsLanguages,
+  workingCachePath,
   workingContentPath,
   workingTranslationsPath
 } from './common'
@@ -27,12 +29,23 @@ const getWorkingPath = function (language: string = 'en') {
   return language == 'en' ? workingContentPath : path.join(workingTranslationsPath, language)
 }
 
+// files copied before keep the modification time of their source
+const isSameFile = function (src: string, dest: string) {
+  if (!fs.existsSync(dest)) {
+    return false
+  }
+  const srcStat = fs.statSync(src)
+  const destStat = fs.statSync(dest)
+  return srcStat.size == destStat.size && srcStat.mtimeMs == destStat.mtimeMs
+}
+
 const copyNotebookAssets = function (
   srcDir: string, destDir: string, filterFunc: CallableFunction
 ) {
   console.log(`textbook converter: Copying assets from ${srcDir}`)
 
   fs.copySync(srcDir, destDir, {
+    preserveTimestamps: true,
     filter: (src: string, dest: string) => {
       const name = path.basename(src)
       if (name.startsWith('.')) {
@@ -40,34 +53,124 @@ const copyNotebookAssets = function (
       } else if (fs.statSync(src).isDirectory()) {
         return true
       } else {
-        return filterFunc(src, dest)
+        return filterFunc(src, dest) && !isSameFile(src, dest)
       }
     }
   })
 }
 
-const runConverter = function (
-  tocPath: string,
-  nbPath: string,
-  outPath: string
-) {
-  console.log('textbook converter', arguments)
-
+const runConverter = function (languages: Array<string>) {
   const converterPath = path.join(CWD, 'converter', 'textbook-converter')
 
+  // one converter process converts all languages in a single pool of workers
   // TODO: replace converter Python implementation with a Node.js implementation
-  return spawn('python3', [
+  const args = [
+    '-u', '-m',
+    'textbook_converter',
+    '-c', workingCachePath,
+    '--shared', path.join(getNotebookPath('en'), 'shared'),
+    // copy only the images and resources the pages reference
+    '--copy-assets',
+    // delete the outputs of removed or renamed notebooks and chapters
+    '--prune'
+  ]
+  languages.forEach(language => {
+    args.push('-l', language, getTOCPath(language), getNotebookPath(language), getWorkingPath(language))
+  })
+  // `--jobs` without a value uses one worker process per CPU
+  args.push('--jobs')
+
+  console.log('textbook converter', languages)
+  const subprocess = spawn('python3', args, {
+    cwd: converterPath
+  })
+
+  subprocess.stdout.on('data', (data) => {
+    console.log(`textbook converter: ${data}`)
+  })
+  subprocess.stderr.on('data', (data) => {
+    console.error(`textbook converter: ${data}`)
+  })
+  subprocess.on('close', () => {
+    console.log('textbook converter: completed')
+  })
+
+  return subprocess
+}
+
+const watchConverter = function (languages: Array<string>) {
+  const converterPath = path.join(CWD, 'converter', 'textbook-converter')
+
+  // one converter process converts all languages, then keeps converting
+  // the notebooks that changed, see "Server mode" in converter/README.md
+  const subprocess = spawn('python3', [
     '-u', '-m',
-    'textbook_converter', tocPath,
-    '-n', nbPath,
-    '-o', outPath
+    'textbook_converter',
+    '--serve',
+    '--jobs'
   ], {
     cwd: converterPath
   })
+
+  let lastId = 0
+  const pending = new Set<number>()
+  const request = function (method: string, params: object) {
+    lastId += 1
+    pending.add(lastId)
+    subprocess.stdin.write(JSON.stringify({ jsonrpc: '2.0', id: lastId, method, params }) + '\n')
+  }
+
+  // stdout only has the JSON-RPC messages, the converter prints to stderr
+  readline.createInterface({ input: subprocess.stdout }).on('line', (line: string) => {
+    const message = JSON.parse(line)
+    if (message.method == 'progress') {
+      return
+    }
+    pending.delete(message.id)
+    if (message.error) {
+      console.error(`textbook converter: ${message.error.message}`)
+    } else if (message.result.converted || message.result.failed) {
+      const { language, converted, cached, failed, seconds } = message.result
+      console.log(`textbook converter [${language}]: ${converted} converted, ${cached} cached, ${failed} failed in ${seconds}s`)
+    }
+  })
+  subprocess.stderr.on('data', (data) => {
+    console.log(`textbook converter: ${data}`)
+  })
+
+  languages.forEach(language => {
+    request('convert', {
+      language,
+      toc: getTOCPath(language),
+      notebooks: getNotebookPath(language),
+      output: getWorkingPath(language),
+      cache: path.join(workingCachePath, language),
+      fragments: path.join(workingCachePath, 'fragments'),
+      // the converter copies `shared/`, defaulting to English
+      shared: path.join(getNotebookPath('en'), 'shared')
+    })
+  })
+
+  // once the previous requests are done, convert the notebooks changed since
+  const timer = setInterval(() => {
+    if (pending.size == 0) {
+      languages.forEach(language => {
+        request('update', { language, output: getWorkingPath(language) })
+      })
+    }
+  }, 500)
+  subprocess.on('close', () => {
+    clearInterval(timer)
+    console.log('textbook converter: stopped')
+  })
+
+  return subprocess
 }
 
 const clean = function () {
-  // Ensure that the directories containing the md files are empty
+  // Empty the directories containing the md files (with `--clean`). Otherwise
+  // the converter only rewrites the files that changed, so the app build
+  // can skip the others, and deletes the files it did not write (`--prune`)
   fs.emptyDirSync(workingContentPath)
   fs.emptyDirSync(workingTranslationsPath)
 }
@@ -76,18 +179,6 @@ const prepare = function (language: string) {
   const notebooks = getNotebookPath(language)
   const working = getWorkingPath(language)
 
-  const notebooksShared = path.join(notebooks, 'shared')
-  const workingShared = path.join(working, 'shared')
-
-  // copy over `shared/`
-  if (fs.existsSync(notebooksShared)) {
-    fs.copySync(notebooksShared, workingShared)
-  } else {
-    // default to English if doesn't exist
-    const shared = path.join(getNotebookPath('en'), 'shared')
-    fs.copySync(shared, workingShared)
-  }
-
   // copy over notebook `images/`
   copyNotebookAssets(notebooks, working, (src: string, dest: string) => {
     return path.dirname(src).split(path.sep).indexOf(nbImagesDirName) > -1
@@ -99,25 +190,6 @@ const prepare = function (language: string) {
   })
 }
 
-const convert = function (language: string) {
-  // run Python converter package
-  const subprocess = runConverter(
-    getTOCPath(language),
-    getNotebookPath(language),
-    getWorkingPath(language)
-  )
-
-  subprocess.stdout.on('data', (data) => {
-    console.log(`textbook converter [${language}]: ${data}`)
-  });
-  subprocess.stderr.on('data', (data) => {
-    console.error(`textbook converter [${language}]: ${data}`)
-  });
-  subprocess.on('close', () => {
-    console.log(`textbook converter [${language}]: completed`)
-  })
-}
-
 const run = function () {
   // run conversion for each available language
 
@@ -130,11 +202,20 @@ const run = function () {
     return src.includes('toc.yaml')
   })
 
-  translationsLanguages.forEach(language => {
-    prepare(language)
-    convert(language)
-  })
+  if (process.argv.includes('--watch')) {
+    translationsLanguages.forEach(language => {
+      prepare(language)
+    })
+    watchConverter(translationsLanguages)
+    return
+  }
+
+  // the converter copies `shared/`, defaulting to English, and the
+  // referenced images and resources
+  runConverter(translationsLanguages)
 }
 
-clean()
+if (process.argv.includes('--clean')) {
+  clean()
+}
 run()
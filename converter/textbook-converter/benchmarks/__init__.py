@@ -0,0 +1,5 @@
+"""Benchmarks for the textbook converter
+
+    python -m benchmarks run -o results.json
+    python -m benchmarks compare results.json
+"""
@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+import nbformat
+
+from textbook_converter import TextbookExporter, __version__
+from textbook_converter.TextbookExporter import handle_code_cell, handle_markdown_cell
+
+from .generate import generate_notebook, write_toc
+
+
+BASELINE_FILE_PATH = Path(__file__).parent / 'baseline.json'
+
+# each scenario scales one dimension of the default notebook
+SCENARIOS = {
+    'default': {},
+    'many-cells': {'cells': 200},
+    'long-lines': {'line_length': 2000},
+    'inline-code': {'inline_code': 40},
+    'latex': {'latex_blocks': 20},
+    'text-output': {'text_output': 50000},
+    'svg-output': {'svg_output': 200000},
+    'png-output': {'png_output': 100000}
+}
+
+
+def measure(func, repeat):
+    """Call func `repeat` times, return the min and median wall time in seconds
+
+    func is called once more before, so that imports and caches warmed up by
+    the first call are not measured.
+    """
+    func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times)}
+
+
+def calibrate(repeat):
+    """Time a fixed workload, that does not depend on the converter, to scale the benchmarks with
+
+    Benchmarks are stored relative to this time, so that a baseline can be
+    compared with results of another machine, or of a busier one.
+    """
+    nb = generate_notebook(cells=20)
+    text = nbformat.writes(nb)
+    word_regex = re.compile(r'\b\w+\b')
+
+    def workload():
+        json.loads(text)
+        sum(1 for _ in word_regex.finditer(text))
+        text.replace('\n', '\n    ')
+
+    return measure(workload, repeat * 5)
+
+
+def benchmark_scenario(scenario, repeat):
+    nb = generate_notebook(**scenario)
+    markdown_cells = [cell for cell in nb.cells if cell.cell_type == 'markdown']
+    code_cells = [cell for cell in nb.cells if cell.cell_type == 'code']
+    resources = {'textbook': {'id': 'bench', 'section': 'bench'}}
+
+    def markdown():
+        for count, cell in enumerate(markdown_cells):
+            handle_markdown_cell(cell, resources, count)
+
+    def code():
+        for cell in code_cells:
+            handle_code_cell(cell, resources)
+
+    exporter = TextbookExporter()
+
+    def export():
+        # measure rendering, not the cell cache
+        TextbookExporter.cell_cache.clear()
+        exporter.from_notebook_node(nb, resources={'textbook': {'id': 'bench', 'section': 'bench'}})
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        notebooks_dir = os.path.join(tmp_dir, 'notebooks')
+        toc_file_path = write_toc(notebooks_dir, scenario)
+
+        def toc():
+            output_dir = os.path.join(tmp_dir, 'output')
+            os.makedirs(os.path.join(output_dir, 'shared'), exist_ok=True)
+            subprocess.run(
+                [sys.executable, '-m', 'textbook_converter', toc_file_path, '-o', output_dir],
+                check=True,
+                stdout=subprocess.DEVNULL,
+                cwd=Path(__file__).resolve().parent.parent
+            )
+
+        return {
+            'handle_markdown_cell': measure(markdown, repeat),
+            'handle_code_cell': measure(code, repeat),
+            'from_notebook_node': measure(export, repeat),
+            'toc': measure(toc, max(1, repeat // 5))
+        }
+
+
+def run_round(scenarios, repeat):
+    """Run the benchmarks of the scenarios once, return the calibration time and the timings"""
+    calibrations = []
+    timings = {}
+    for name in scenarios:
+        calibrations.append(calibrate(repeat)['median'])
+        timings[name] = benchmark_scenario(SCENARIOS[name], repeat)
+
+    # measured around each scenario, the median is robust to a busy moment
+    calibration = statistics.median(calibrations)
+    for benchmarks in timings.values():
+        for timing in benchmarks.values():
+            timing['relative'] = timing['median'] / calibration
+    return calibration, timings
+
+
+def run(output_file_path=None, scenarios=None, repeat=10, rounds=1):
+    """Run the benchmarks of the scenarios, print and return the results
+
+    With several rounds, each benchmark keeps the median of its rounds
+    (the minimum for `min`), so that a noisy round does not skew it.
+    """
+    results = {
+        'converter': __version__,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'repeat': repeat,
+        'rounds': rounds,
+        'scenarios': {}
+    }
+
+    scenarios = scenarios or list(SCENARIOS)
+    calibrations, all_timings = zip(*(run_round(scenarios, repeat) for _ in range(rounds)))
+
+    results['calibration'] = statistics.median(calibrations)
+    for name in scenarios:
+        results['scenarios'][name] = {}
+        for benchmark in all_timings[0][name]:
+            timings = [round_timings[name][benchmark] for round_timings in all_timings]
+            timing = {
+                'min': min(t['min'] for t in timings),
+                'median': statistics.median(t['median'] for t in timings),
+                'relative': statistics.median(t['relative'] for t in timings)
+            }
+            results['scenarios'][name][benchmark] = timing
+            print(
+                f'{name:<12} {benchmark:<22} {timing["median"] * 1000:10.2f} ms '
+                f'{timing["relative"]:10.2f} x calibration'
+            )
+
+    if output_file_path:
+        with open(output_file_path, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+            output_file.write('\n')
+    return results
+
+
+def compare(baseline_file_path, results_file_path, threshold=0.5):
+    """Print the change of each benchmark, return the regressions beyond threshold
+
+    Benchmarks are compared on their median time relative to the
+    calibration workload (see `calibrate`), which is stable across
+    machines and runs.
+    """
+    with open(baseline_file_path, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)['scenarios']
+    with open(results_file_path, encoding='utf-8') as results_file:
+        results = json.load(results_file)['scenarios']
+
+    regressions = []
+    for name, benchmarks in results.items():
+        for benchmark, timing in benchmarks.items():
+            if 'relative' not in baseline.get(name, {}).get(benchmark, {}):
+                continue
+            base = baseline[name][benchmark]['relative']
+            change = timing['relative'] / base - 1 if base else 0
+            regressed = change > threshold
+            if regressed:
+                regressions.append((name, benchmark, change))
+            print(
+                f'{name:<12} {benchmark:<22} {base:10.2f} x -> '
+                f'{timing["relative"]:10.2f} x {change:+7.1%}'
+                f'{"  REGRESSION" if regressed else ""}'
+            )
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Benchmark the textbook converter on generated notebooks'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument(
+        '-o', '--output', type=str, nargs=1,
+        help='JSON file to write the results to'
+    )
+    run_parser.add_argument(
+        '-s', '--scenario', type=str, action='append', choices=list(SCENARIOS),
+        help='scenario to run (default: all), can be repeated'
+    )
+    run_parser.add_argument(
+        '-r', '--repeat', type=int, nargs=1,
+        help='number of times each benchmark is run (default: 10)'
+    )
+    run_parser.add_argument(
+        '--rounds', type=int, nargs=1,
+        help='number of times all benchmarks are run, keeping the median of each (default: 1)'
+    )
+
+    compare_parser = subparsers.add_parser(
+        'compare', help='compare results to a baseline, and fail on regressions'
+    )
+    compare_parser.add_argument(
+        'results', type=str,
+        help='JSON file with the results to compare'
+    )
+    compare_parser.add_argument(
+        '-b', '--baseline', type=str, nargs=1,
+        help=f'JSON file with the baseline results (default: {BASELINE_FILE_PATH})'
+    )
+    compare_parser.add_argument(
+        '-t', '--threshold', type=float, nargs=1,
+        help='slowdown allowed before failing, as a fraction (default: 0.5)'
+    )
+    compare_parser.add_argument(
+        '--no-fail', action='store_true',
+        help='only report the regressions, e.g. on a busy machine, instead of exiting with an error'
+    )
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run(
+            args.output[0] if args.output else None,
+            args.scenario,
+            args.repeat[0] if args.repeat else 10,
+            args.rounds[0] if args.rounds else 1
+        )
+    else:
+        regressions = compare(
+            args.baseline[0] if args.baseline else BASELINE_FILE_PATH,
+            args.results,
+            args.threshold[0] if args.threshold else 0.5
+        )
+        if regressions:
+            print(f'{len(regressions)} benchmarks regressed')
+            if not args.no_fail:
+                sys.exit(1)
@@ -0,0 +1,139 @@
+import base64
+import os
+import random
+
+import nbformat
+
+from nbformat.v4 import (
+    new_code_cell,
+    new_markdown_cell,
+    new_notebook,
+    new_output
+)
+
+
+WORDS = (
+    'qubit state vector amplitude gate circuit measure probability phase '
+    'superposition entangled basis operator matrix register oracle'
+).split()
+
+SVG_TEMPLATE = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}">\n'
+    '{shapes}'
+    '</svg>\n'
+)
+
+
+def generate_text(rng, length, inline_code=0):
+    """Return a line of about `length` characters, with `inline_code` code spans
+    """
+    words = []
+    while sum(len(w) + 1 for w in words) < length:
+        words.append(rng.choice(WORDS))
+    for _ in range(inline_code):
+        words.insert(rng.randrange(len(words) + 1), f'`{rng.choice(WORDS)}()`')
+    words.insert(rng.randrange(len(words) + 1), f'$|{rng.choice("01+-")}\\rangle$')
+    return ' '.join(words)
+
+
+def generate_markdown_source(rng, count, line_length, inline_code, latex_blocks):
+    lines = [f'## {generate_text(rng, 20)} {count}', '']
+    for _ in range(4):
+        lines.append(generate_text(rng, line_length, inline_code))
+    for _ in range(latex_blocks):
+        lines += [
+            '',
+            '$$',
+            '\\begin{bmatrix} \\alpha \\\\ \\beta \\end{bmatrix} = '
+            '\\alpha|0\\rangle + \\beta|1\\rangle',
+            '$$',
+            ''
+        ]
+    return '\n'.join(lines)
+
+
+def generate_outputs(rng, text_output, svg_output, png_output):
+    outputs = []
+    if text_output:
+        lines = [generate_text(rng, 60) for _ in range(max(1, text_output // 60))]
+        outputs.append(new_output('stream', name='stdout', text='\n'.join(lines)))
+    if svg_output:
+        shapes = ''.join(
+            f'  <rect x="{i % 100}" y="{i // 100}" width="1" height="1" fill="#{i % 4096:03x}"/>\n'
+            for i in range(max(1, svg_output // 70))
+        )
+        outputs.append(new_output(
+            'display_data',
+            data={'image/svg+xml': SVG_TEMPLATE.format(size=100, shapes=shapes)}
+        ))
+    if png_output:
+        data = bytes(rng.getrandbits(8) for _ in range(png_output))
+        outputs.append(new_output(
+            'display_data',
+            data={'image/png': base64.b64encode(data).decode('ascii')}
+        ))
+    return outputs
+
+
+def generate_notebook(
+    cells=20,
+    line_length=80,
+    inline_code=1,
+    latex_blocks=1,
+    text_output=200,
+    svg_output=0,
+    png_output=0,
+    seed=0
+):
+    """Return a notebook of alternating markdown and code cells
+
+    Markdown cells have lines of `line_length` characters, each with
+    `inline_code` code spans, and `latex_blocks` LaTeX blocks. Code cells
+    have outputs of about `text_output` characters of text, `svg_output`
+    characters of SVG and `png_output` bytes of PNG data.
+    """
+    rng = random.Random(seed)
+    nb = new_notebook()
+    for count in range(cells):
+        if count % 2 == 0:
+            nb.cells.append(new_markdown_cell(generate_markdown_source(
+                rng, count, line_length, inline_code, latex_blocks
+            )))
+        else:
+            cell = new_code_cell(
+                f'from qiskit import QuantumCircuit\n'
+                f'qc = QuantumCircuit({count % 5 + 1})\n'
+                f'qc.h(0)  # {generate_text(rng, 30)}\n'
+                f'qc.draw()'
+            )
+            cell.outputs = generate_outputs(rng, text_output, svg_output, png_output)
+            nb.cells.append(cell)
+    return nb
+
+
+def write_toc(output_dir, scenario, chapters=2, sections=3):
+    """Write a toc yaml and its notebooks generated for the scenario, return the toc path
+    """
+    toc_lines = []
+    for chapter in range(chapters):
+        toc_lines += [
+            f'- title: Chapter {chapter}',
+            f'  url: /chapter-{chapter}',
+            '  sections:'
+        ]
+        os.makedirs(os.path.join(output_dir, f'chapter-{chapter}'), exist_ok=True)
+        for section in range(sections):
+            nb = generate_notebook(**scenario, seed=chapter * sections + section)
+            nb_path = os.path.join(output_dir, f'chapter-{chapter}', f'section-{section}.ipynb')
+            nbformat.write(nb, nb_path)
+            toc_lines += [
+                f'    - title: Section {section}',
+                f'      id: section-{chapter}-{section}',
+                f'      uuid: 00000000-0000-0000-0000-{chapter:06d}{section:06d}',
+                f'      url: /chapter-{chapter}/section-{section}'
+            ]
+
+    toc_path = os.path.join(output_dir, 'toc.yaml')
+    with open(toc_path, 'w', encoding='utf-8') as toc_file:
+        toc_file.write('\n'.join(toc_lines) + '\n')
+    return toc_path
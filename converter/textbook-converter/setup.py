@@ -29,6 +29,10 @@ setup(
   ],
   license='Apache-2.0',
   install_requires=requirements,
+  extras_require={
+    'images': ['Pillow>=9.1'],
+    'test': ['pytest']
+  },
   packages=find_packages(include=['textbook_converter']),
   url='https://github.com/Qiskit/platypus/tree/main/converter/textbook-converter',
   python_requires='>=3.6',
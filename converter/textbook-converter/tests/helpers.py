@@ -0,0 +1,31 @@
+"""Notebooks and toc files for the tests"""
+import nbformat
+import yaml
+
+
+def write_notebook(file_path, title, gloss):
+    nb = nbformat.v4.new_notebook()
+    nb.cells = [
+        nbformat.v4.new_markdown_cell(f'# {title}\n\n## Intro\n\nSome text'),
+        nbformat.v4.new_markdown_cell('A term', metadata={'gloss': gloss})
+    ]
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    nbformat.write(nb, str(file_path))
+
+
+def write_toc(nb_path, section_ids):
+    toc = [{
+        'title': 'Basics',
+        'url': '/basics',
+        'sections': [
+            {'title': id, 'id': id, 'uuid': f'uuid-{id}', 'url': f'/basics/{id}'}
+            for id in section_ids
+        ]
+    }]
+    toc_path = nb_path / 'toc.yaml'
+    toc_path.write_text(yaml.dump(toc), encoding='utf-8')
+    return toc_path
+
+
+def read_yaml(file_path):
+    return yaml.safe_load(file_path.read_text(encoding='utf-8'))
@@ -0,0 +1,74 @@
+"""Tests of the shared files accumulator"""
+from textbook_converter.accumulator import ResourceAccumulator, to_yaml_strings
+
+from helpers import read_yaml
+
+
+def test_sources_are_merged_and_replaced(tmp_path):
+    glossary_path = tmp_path / 'glossary.yaml'
+    accumulator = ResourceAccumulator()
+    accumulator.add(glossary_path, 'a.ipynb', {'qubit': {'text': 'a qubit'}})
+    accumulator.add(glossary_path, 'b.ipynb', {'tensor': {'text': 'a product'}})
+    accumulator.add(glossary_path, 'a.ipynb', {'state': {'text': 'a state'}})
+    accumulator.write()
+
+    assert read_yaml(glossary_path) == {
+        'state': {'text': 'a state'}, 'tensor': {'text': 'a product'}
+    }
+
+
+def test_conflicting_keys_are_reported_once(tmp_path, capsys):
+    glossary_path = tmp_path / 'glossary.yaml'
+    accumulator = ResourceAccumulator()
+    accumulator.add(glossary_path, 'a.ipynb', {'qubit': {'text': 'a qubit'}})
+    accumulator.add(glossary_path, 'b.ipynb', {'qubit': {'text': 'a quantum bit'}})
+    accumulator.add(glossary_path, 'c.ipynb', {'qubit': {'text': 'a quantum bit'}})
+
+    assert accumulator.get_content(glossary_path) == {'qubit': {'text': 'a quantum bit'}}
+    accumulator.get_content(glossary_path)
+    assert capsys.readouterr().out.splitlines() == [
+        f'{glossary_path}: "qubit" in b.ipynb overrides a.ipynb'
+    ]
+
+
+def test_yaml_files_start_from_their_base_only(tmp_path):
+    base_path = tmp_path / 'base.yaml'
+    base_path.write_text('bit:\n  text: a bit\n', encoding='utf-8')
+    glossary_path = tmp_path / 'glossary.yaml'
+    glossary_path.write_text('old:\n  text: from a previous build\n', encoding='utf-8')
+
+    accumulator = ResourceAccumulator()
+    accumulator.add_base(glossary_path, base_path)
+    accumulator.add(glossary_path, 'a.ipynb', {'qubit': {'text': 'a qubit'}})
+    assert set(accumulator.get_content(glossary_path)) == {'bit', 'qubit'}
+
+    index_path = tmp_path / 'index.yaml'
+    index_path.write_text('old: []\n', encoding='utf-8')
+    accumulator.add(index_path, 'a.ipynb', {'single': []})
+    assert accumulator.get_content(index_path) == {'single': []}
+
+    accumulator = ResourceAccumulator(update_existing=True)
+    accumulator.add(index_path, 'a.ipynb', {'single': []})
+    assert accumulator.get_content(index_path) == {'old': [], 'single': []}
+
+
+def test_text_files_append_sources_to_the_header(tmp_path):
+    ts_path = tmp_path / 'functions.ts'
+    accumulator = ResourceAccumulator()
+    accumulator.add_text(ts_path, 'a.ipynb', '\n\nexport function a() {}', 'header\n')
+    accumulator.add_text(ts_path, 'b.ipynb', '\n\nexport function b() {}', 'header\n')
+    accumulator.write(ts_path)
+
+    assert ts_path.read_text(encoding='utf-8') == (
+        'header\n\n\nexport function a() {}\n\nexport function b() {}'
+    )
+
+    accumulator.discard(ts_path)
+    accumulator.add_text(ts_path, 'b.ipynb', '', 'header\n')
+    assert accumulator.get_text(ts_path) == 'header\n'
+
+
+def test_values_are_strings_like_base_loader():
+    assert to_yaml_strings({1: [2.5, True, None, 'text'], 'a': {'b': 3}}) == {
+        '1': ['2.5', 'true', 'null', 'text'], 'a': {'b': '3'}
+    }
@@ -0,0 +1,91 @@
+"""Tests of the build cache"""
+import json
+
+from textbook_converter.cache import BuildCache, get_section_hash
+from textbook_converter.converter import convert_toc
+
+from helpers import write_notebook, write_toc
+
+
+def test_section_hash_covers_everything_the_conversion_depends_on(tmp_path):
+    nb_file_path = tmp_path / 'single.ipynb'
+    write_notebook(nb_file_path, 'Single', {'qubit': {'text': 'a qubit'}})
+    section_hash = get_section_hash(nb_file_path, 'single', False, {}, '1')
+
+    assert get_section_hash(nb_file_path, 'single', False, {}, '1') == section_hash
+    assert get_section_hash(nb_file_path, 'other', False, {}, '1') != section_hash
+    assert get_section_hash(nb_file_path, 'single', True, {}, '1') != section_hash
+    assert get_section_hash(nb_file_path, 'single', False, {'assets_dir': 'a'}, '1') != section_hash
+    assert get_section_hash(nb_file_path, 'single', False, {}, '2') != section_hash
+    write_notebook(nb_file_path, 'Single', {'state': {'text': 'a state'}})
+    assert get_section_hash(nb_file_path, 'single', False, {}, '1') != section_hash
+
+
+def test_cached_sections_are_restored(tmp_path):
+    nb_file_path = tmp_path / 'single.ipynb'
+    write_notebook(nb_file_path, 'Single', {'qubit': {'text': 'a qubit'}})
+    output_path = tmp_path / 'output'
+    output_path.mkdir()
+    (output_path / 'single.md').write_text('# Single', encoding='utf-8')
+    resources = {'textbook': {'glossary': {'qubit': {}}, 'id': 'single', 'assets': ['a.png']}}
+
+    cache = BuildCache(tmp_path / 'cache')
+    section_hash = cache.section_hash(nb_file_path, 'single')
+    assert not cache.is_cached(nb_file_path, section_hash)
+    cache.store(nb_file_path, section_hash, output_path, resources)
+    cache.save()
+
+    cache = BuildCache(tmp_path / 'cache')
+    assert cache.is_cached(nb_file_path, section_hash)
+    # the assets written by the section must still exist
+    assert not cache.is_cached(nb_file_path, section_hash, {'assets_dir': str(tmp_path)})
+    (tmp_path / 'a.png').write_bytes(b'png')
+    assert cache.is_cached(nb_file_path, section_hash, {'assets_dir': str(tmp_path)})
+
+    restored = cache.restore(nb_file_path, section_hash, tmp_path / 'restored')
+    assert restored == {'textbook': {'glossary': {'qubit': {}}, 'assets': ['a.png']}}
+    assert (tmp_path / 'restored/single.md').read_text(encoding='utf-8') == '# Single'
+
+    write_notebook(nb_file_path, 'Single', {'state': {'text': 'a state'}})
+    new_hash = cache.section_hash(nb_file_path, 'single')
+    assert not cache.is_cached(nb_file_path, new_hash)
+    cache.store(nb_file_path, new_hash, output_path, resources)
+    cache.save()
+    # the files of the previous hash are removed
+    assert sorted(path.stem for path in (tmp_path / 'cache/sections').iterdir()) == [new_hash] * 2
+
+
+def test_converter_version_change_invalidates_the_cache(tmp_path):
+    nb_file_path = tmp_path / 'single.ipynb'
+    write_notebook(nb_file_path, 'Single', {'qubit': {'text': 'a qubit'}})
+    (tmp_path / 'single.md').write_text('# Single', encoding='utf-8')
+    cache = BuildCache(tmp_path / 'cache')
+    section_hash = cache.section_hash(nb_file_path, 'single')
+    cache.store(nb_file_path, section_hash, tmp_path, {})
+    cache.save()
+
+    manifest_path = tmp_path / 'cache/manifest.json'
+    manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+    manifest['version'] = 'older'
+    manifest_path.write_text(json.dumps(manifest), encoding='utf-8')
+
+    assert not BuildCache(tmp_path / 'cache').is_cached(nb_file_path, section_hash)
+
+
+def test_only_changed_sections_are_converted_again(tmp_path):
+    nb_path = tmp_path / 'notebooks'
+    output_path = tmp_path / 'output'
+    write_notebook(nb_path / 'basics/single.ipynb', 'Single', {'qubit': {'text': 'a qubit'}})
+    write_notebook(nb_path / 'basics/multiple.ipynb', 'Multiple', {'tensor': {'text': 'a product'}})
+    toc_path = write_toc(nb_path, ['single', 'multiple'])
+    cache_dir = str(tmp_path / 'cache')
+
+    summary = convert_toc(str(toc_path), output_dir=str(output_path), cache_dir=cache_dir)
+    assert (summary['converted'], summary['cached']) == (2, 0)
+
+    summary = convert_toc(str(toc_path), output_dir=str(output_path), cache_dir=cache_dir)
+    assert (summary['converted'], summary['cached'], summary['changed']) == (0, 2, 0)
+
+    write_notebook(nb_path / 'basics/single.ipynb', 'Single', {'state': {'text': 'a state'}})
+    summary = convert_toc(str(toc_path), output_dir=str(output_path), cache_dir=cache_dir)
+    assert (summary['converted'], summary['cached']) == (1, 1)
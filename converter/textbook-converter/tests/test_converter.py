@@ -0,0 +1,91 @@
+"""Tests of the toc conversion"""
+import pytest
+
+from textbook_converter.converter import convert_toc, remove_stale_outputs
+
+from helpers import read_yaml, write_notebook, write_toc
+
+
+def test_removed_section_is_removed_from_merged_files(tmp_path):
+    nb_path = tmp_path / 'notebooks'
+    output_path = tmp_path / 'output'
+    write_notebook(nb_path / 'basics/single.ipynb', 'Single', {'qubit': {'text': 'a qubit'}})
+    write_notebook(nb_path / 'basics/multiple.ipynb', 'Multiple', {'tensor': {'text': 'a product'}})
+    (nb_path / 'shared').mkdir()
+    (nb_path / 'shared/glossary.yaml').write_text('bit:\n  text: a bit\n', encoding='utf-8')
+
+    toc_path = write_toc(nb_path, ['single', 'multiple'])
+    convert_toc(str(toc_path), output_dir=str(output_path), prune=True)
+
+    assert set(read_yaml(output_path / 'basics/index.yaml')) == {'single', 'multiple'}
+    assert set(read_yaml(output_path / 'shared/glossary.yaml')) == {'bit', 'qubit', 'tensor'}
+    assert (output_path / 'basics/multiple.md').is_file()
+
+    (nb_path / 'basics/multiple.ipynb').unlink()
+    toc_path = write_toc(nb_path, ['single'])
+    convert_toc(str(toc_path), output_dir=str(output_path), prune=True)
+
+    assert set(read_yaml(output_path / 'basics/index.yaml')) == {'single'}
+    assert set(read_yaml(output_path / 'shared/glossary.yaml')) == {'bit', 'qubit'}
+    assert not (output_path / 'basics/multiple.md').exists()
+    assert 'multiple' not in (output_path / 'basics/content.md').read_text(encoding='utf-8')
+
+
+def test_edited_notebook_replaces_its_contributions(tmp_path):
+    nb_path = tmp_path / 'notebooks'
+    output_path = tmp_path / 'output'
+    write_notebook(nb_path / 'basics/single.ipynb', 'Single', {'qubit': {'text': 'a qubit'}})
+    toc_path = write_toc(nb_path, ['single'])
+    convert_toc(str(toc_path), output_dir=str(output_path))
+
+    write_notebook(nb_path / 'basics/single.ipynb', 'Single', {'state': {'text': 'a state'}})
+    convert_toc(str(toc_path), output_dir=str(output_path))
+
+    assert set(read_yaml(output_path / 'shared/glossary.yaml')) == {'state'}
+
+
+def test_remove_stale_outputs(tmp_path):
+    kept = ['.git/config', 'basics/content.md', 'shared/toc.yaml']
+    assets = ['basics/images/a.png', 'old/resources/b.txt']
+    for rel_path in kept + assets + ['basics/old.md', 'old/content.md']:
+        (tmp_path / rel_path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / rel_path).write_text(rel_path, encoding='utf-8')
+    outputs = {str((tmp_path / 'basics/content.md').resolve()): False}
+
+    def get_files():
+        return sorted(
+            path.relative_to(tmp_path).as_posix() for path in tmp_path.rglob('*') if path.is_file()
+        )
+
+    assert remove_stale_outputs(tmp_path, outputs, keep_assets=True) == 2
+    assert get_files() == sorted(kept + assets)
+
+    assert remove_stale_outputs(tmp_path, outputs) == 2
+    assert get_files() == kept
+    # directories left empty are removed
+    assert not (tmp_path / 'old').exists()
+    assert not (tmp_path / 'basics/images').exists()
+
+
+def test_unchanged_build_writes_no_files(tmp_path):
+    nb_path = tmp_path / 'notebooks'
+    output_path = tmp_path / 'output'
+    write_notebook(nb_path / 'basics/single.ipynb', 'Single', {'qubit': {'text': 'a qubit'}})
+    toc_path = write_toc(nb_path, ['single'])
+    summary = convert_toc(str(toc_path), output_dir=str(output_path))
+    assert summary['changed'] > 0
+    mtimes = {path: path.stat().st_mtime_ns for path in output_path.rglob('*') if path.is_file()}
+
+    summary = convert_toc(str(toc_path), output_dir=str(output_path), prune=True)
+
+    assert summary['changed'] == 0
+    assert {path: path.stat().st_mtime_ns for path in output_path.rglob('*') if path.is_file()} == mtimes
+
+
+def test_notebooks_directory_is_not_pruned(tmp_path):
+    write_notebook(tmp_path / 'basics/single.ipynb', 'Single', {'qubit': {'text': 'a qubit'}})
+    toc_path = write_toc(tmp_path, ['single'])
+
+    with pytest.raises(ValueError):
+        convert_toc(str(toc_path), prune=True)
+    assert (tmp_path / 'basics/single.ipynb').is_file()
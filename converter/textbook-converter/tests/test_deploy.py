@@ -0,0 +1,71 @@
+"""Tests of the deploy packager"""
+import json
+import os
+
+from textbook_converter.deploy import get_build_files, package
+from textbook_converter.manifest import MANIFEST_FILE_NAME, get_files
+
+
+def write_build(build_path, files):
+    for rel_path, text in files.items():
+        file_path = build_path / rel_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text(text, encoding='utf-8')
+
+
+def write_build_manifest(build_path, rel_paths):
+    files = get_files([str(build_path / rel_path) for rel_path in rel_paths], build_path)
+    manifest = {'sections': {}, 'chapters': {'basics': {'files': files}}, 'shared': {}}
+    (build_path / MANIFEST_FILE_NAME).write_text(json.dumps(manifest), encoding='utf-8')
+
+
+def test_package_added_changed_and_deleted_files(tmp_path):
+    previous_path = tmp_path / 'previous'
+    build_path = tmp_path / 'build'
+    write_build(previous_path, {
+        'basics/content.md': 'one', 'basics/index.yaml': 'a: b', 'old/content.md': 'old'
+    })
+    write_build(build_path, {
+        'basics/content.md': 'two', 'basics/index.yaml': 'a: b', 'new/content.md': 'new'
+    })
+
+    deploy = package(build_path, tmp_path / 'package', previous_path)
+
+    assert deploy['added'] == ['new/content.md']
+    assert deploy['changed'] == ['basics/content.md']
+    assert deploy['deleted'] == ['old/content.md']
+    assert sorted(
+        path.relative_to(tmp_path / 'package/files').as_posix()
+        for path in (tmp_path / 'package/files').rglob('*') if path.is_file()
+    ) == ['basics/content.md', 'new/content.md']
+    assert (tmp_path / 'package/deleted.txt').read_text(encoding='utf-8') == 'old/content.md\n'
+
+    # the next build is compared with the deploy.json of the package
+    (build_path / 'basics/content.md').write_text('three', encoding='utf-8')
+    deploy = package(build_path, tmp_path / 'next', tmp_path / 'package/deploy.json')
+    assert (deploy['added'], deploy['changed'], deploy['deleted']) == ([], ['basics/content.md'], [])
+
+
+def test_manifest_hashes_are_reused_for_unmodified_files_only(tmp_path):
+    build_path = tmp_path / 'build'
+    write_build(build_path, {'basics/content.md': 'one', 'basics/index.yaml': 'a: b'})
+    write_build_manifest(build_path, ['basics/content.md', 'basics/index.yaml'])
+    manifest = json.loads((build_path / MANIFEST_FILE_NAME).read_text(encoding='utf-8'))
+    entries = manifest['chapters']['basics']['files']
+
+    # replaced by a file of the same size, with an older modification time (e.g. a copy)
+    file_path = build_path / 'basics/content.md'
+    mtime = file_path.stat().st_mtime_ns
+    file_path.write_text('two', encoding='utf-8')
+    os.utime(file_path, ns=(mtime - 10 ** 9, mtime - 10 ** 9))
+    # a recorded hash is reused as long as the file keeps its time and size
+    (build_path / 'basics/index.yaml').write_text('a: c', encoding='utf-8')
+    mtime = entries['basics/index.yaml']['mtime']
+    os.utime(build_path / 'basics/index.yaml', ns=(mtime, mtime))
+
+    files = get_build_files(build_path)
+
+    assert files['basics/content.md']['hash'] != entries['basics/content.md']['hash']
+    assert files['basics/index.yaml'] == {
+        'hash': entries['basics/index.yaml']['hash'], 'size': entries['basics/index.yaml']['size']
+    }
@@ -0,0 +1,51 @@
+"""Tests of TextbookExporter"""
+import copy
+
+from pathlib import Path
+
+import nbformat
+import pytest
+
+from nbconvert.exporters import Exporter
+
+from textbook_converter import TextbookExporter
+from textbook_converter.TextbookExporter import get_minified_output, minified_outputs
+
+
+REPO_PATH = Path(__file__).resolve().parents[3]
+
+# a notebook with code cell outputs (text, html and images) and attachments
+NB_FILE_PATH = REPO_PATH / 'notebooks/summer-school/2021/resources/lab-notebooks/lab-3.ipynb'
+
+
+@pytest.mark.parametrize('assets', [False, True])
+def test_read_only_does_not_modify_notebook(assets, tmp_path, monkeypatch):
+    nb = nbformat.read(str(NB_FILE_PATH), as_version=4)
+    assert any(cell.get('outputs') for cell in nb.cells)
+    assert any(cell.get('attachments') for cell in nb.cells)
+    nb_copy = copy.deepcopy(nb)
+
+    textbook = {'id': 'lab3', 'section': 'lab3'}
+    if assets:
+        textbook['assets_dir'] = str(tmp_path)
+    TextbookExporter.cell_cache.clear()
+    # the notebook itself is rendered, not the copy made by nbconvert
+    monkeypatch.setattr(Exporter, 'from_notebook_node', None)
+    markdown, _ = TextbookExporter(read_only=True).from_notebook_node(
+        nb, resources={'textbook': textbook}
+    )
+
+    assert markdown
+    assert nb == nb_copy
+
+
+def test_minified_outputs_are_cached_on_disk(tmp_path):
+    svg = '<?xml version="1.0"?>\n<svg>\n  <rect/>\n</svg>\n'
+    minified_outputs.clear()
+    assert get_minified_output('image/svg+xml', svg, str(tmp_path)) == '<svg><rect/></svg>'
+    (cached_path,) = [path for path in tmp_path.rglob('*') if path.is_file()]
+
+    # another process reads the minified output from the cache
+    minified_outputs.clear()
+    cached_path.write_text('<svg><circle/></svg>', encoding='utf-8')
+    assert get_minified_output('image/svg+xml', svg, str(tmp_path)) == '<svg><circle/></svg>'
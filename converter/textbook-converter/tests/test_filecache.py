@@ -0,0 +1,55 @@
+"""Tests of the on-disk caches"""
+import os
+
+from textbook_converter.TextbookExporter import FragmentStore
+from textbook_converter.filecache import FileCache, prune_cache_dir
+
+
+def set_mtime(file_path, seconds):
+    os.utime(file_path, ns=(seconds * 10 ** 9, seconds * 10 ** 9))
+
+
+def test_prune_cache_dir_deletes_least_recently_used_files(tmp_path):
+    for index in range(8):
+        file_path = tmp_path / f'{index:02}' / f'{index}.json'
+        file_path.parent.mkdir()
+        file_path.write_bytes(b'x' * 100)
+        set_mtime(file_path, 1000 + index)
+
+    assert prune_cache_dir(str(tmp_path), max_size=1000) == 0
+    assert prune_cache_dir(str(tmp_path), max_size=500) == 5
+
+    remaining = sorted(path.name for path in tmp_path.rglob('*.json'))
+    assert remaining == ['5.json', '6.json', '7.json']
+
+
+def test_fragments_read_are_kept(tmp_path):
+    store = FragmentStore(str(tmp_path))
+    keys = [f'{index:02}' * 32 for index in range(4)]
+    for index, key in enumerate(keys):
+        store.put(key, {'text': 'x' * 100, 'assets': []})
+        set_mtime(store.get_path(key), 1000 + index)
+
+    assert store.get(keys[0])['text'] == 'x' * 100
+    # down to 2 of the 4 fragments
+    assert prune_cache_dir(str(tmp_path), max_size=3 * os.path.getsize(store.get_path(keys[0]))) == 2
+
+    assert store.get(keys[0]) is not None
+    assert store.get(keys[1]) is None
+    assert store.get(keys[3]) is not None
+
+
+def test_cached_files_read_are_kept(tmp_path):
+    cache = FileCache(str(tmp_path))
+    keys = [f'{index:02}' * 32 for index in range(4)]
+    for index, key in enumerate(keys):
+        cache.put(key, '.png', b'x' * 100)
+        set_mtime(cache.get_path(key, '.png'), 1000 + index)
+
+    assert cache.get(keys[0], '.png') == b'x' * 100
+    assert prune_cache_dir(str(tmp_path), max_size=300) == 2
+
+    assert cache.get(keys[0], '.png') is not None
+    assert cache.get(keys[1], '.png') is None
+    assert cache.get(keys[2], '.png') is None
+    assert cache.get(keys[3], '.png') is not None
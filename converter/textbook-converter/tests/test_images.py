@@ -0,0 +1,66 @@
+"""Tests of the lossless image optimization"""
+import io
+
+import pytest
+
+from textbook_converter.images import get_webp_variants, optimize_png
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def get_png(image, **params):
+    output = io.BytesIO()
+    image.save(output, 'PNG', **params)
+    return output.getvalue()
+
+
+def get_rgba_pixels(data):
+    """Return the RGBA pixels of the image, fully transparent pixels all the same"""
+    with Image.open(io.BytesIO(data)) as image:
+        pixels = image.convert('RGBA').tobytes()
+    return [
+        tuple(pixels[i:i + 4]) if pixels[i + 3] else (0, 0, 0, 0)
+        for i in range(0, len(pixels), 4)
+    ]
+
+
+def test_optimize_png_keeps_transparent_color(tmp_path):
+    # an RGB png with a transparent color (tRNS chunk), and few colors
+    image = Image.new('RGB', (64, 64), (255, 255, 255))
+    for x in range(32):
+        image.putpixel((x, x), (255, 0, 0))
+    data = get_png(image, transparency=(255, 255, 255))
+
+    optimized = optimize_png(data, str(tmp_path))
+
+    assert get_rgba_pixels(optimized) == get_rgba_pixels(data)
+
+
+def test_optimize_png_keeps_pixels_of_palette_image():
+    image = Image.new('RGBA', (64, 64), (0, 0, 255, 255))
+    for x in range(32):
+        image.putpixel((x, 0), (0, x, 0, 255))
+    data = get_png(image)
+
+    optimized = optimize_png(data)
+
+    assert len(optimized) <= len(data)
+    assert get_rgba_pixels(optimized) == get_rgba_pixels(data)
+
+
+def test_optimize_png_returns_unreadable_image_as_is():
+    data = b'\x89PNG\r\n\x1a\nnot a png'
+
+    assert optimize_png(data) == data
+    assert get_webp_variants(data) == []
+
+
+def test_webp_variants_keep_transparent_color():
+    image = Image.new('RGB', (32, 32), (255, 255, 255))
+    image.putpixel((0, 0), (255, 0, 0))
+    data = get_png(image, transparency=(255, 255, 255))
+
+    (width, webp), = get_webp_variants(data)
+
+    assert width == 32
+    assert get_rgba_pixels(webp) == get_rgba_pixels(data)
@@ -0,0 +1,59 @@
+"""Golden output tests of the markdown cells of the repo notebooks
+
+The expected output is in `golden/`, one file per notebook. After an
+intended change of the rendering, regenerate it with:
+
+    UPDATE_GOLDEN=1 python -m pytest tests
+"""
+import os
+
+from pathlib import Path
+
+import nbformat
+import pytest
+
+from textbook_converter.TextbookExporter import handle_markdown_cell
+
+
+REPO_PATH = Path(__file__).resolve().parents[3]
+GOLDEN_PATH = Path(__file__).resolve().parent / 'golden'
+
+# notebooks covering headings, inline and block latex, inline code, images,
+# blanks, vue components, problem sets, attachments and translations
+NOTEBOOKS = [
+    ('notebooks/ch-states/atoms-computation.ipynb', False),
+    ('notebooks/ch-states/representing-qubit-states.ipynb', False),
+    ('notebooks/intro/grover-intro.ipynb', False),
+    ('notebooks/ch-algorithms/quantum-phase-estimation.ipynb', False),
+    ('notebooks/problem-sets/quantum_enigma_problem_set.ipynb', True),
+    ('notebooks/problem-sets/single_systems_problem_set.ipynb', True),
+    ('notebooks/summer-school/2021/resources/lab-notebooks/lab-5.ipynb', False),
+    ('translations/ja/ch-states/atoms-computation.ipynb', False),
+]
+
+
+def render_markdown_cells(nb_file_path, is_problem_set, assets_dir):
+    """Return the markdown and headings of each markdown cell of the notebook"""
+    nb = nbformat.read(str(nb_file_path), as_version=4)
+    # attachments are written to asset files, so the output has their hash, not their data
+    resources = {'textbook': {'assets_dir': str(assets_dir)}}
+    parts = []
+    for count, cell in enumerate(nb.cells):
+        if cell.cell_type != 'markdown':
+            continue
+        markdown, resources, headings = handle_markdown_cell(
+            cell, resources, count, is_problem_set=is_problem_set
+        )
+        parts.append(f'<!-- cell {count}: {headings} -->\n{markdown}\n')
+    return ''.join(parts)
+
+
+@pytest.mark.parametrize('nb_path, is_problem_set', NOTEBOOKS)
+def test_markdown_cells(nb_path, is_problem_set, tmp_path):
+    output = render_markdown_cells(REPO_PATH / nb_path, is_problem_set, tmp_path)
+    golden_file_path = GOLDEN_PATH / (nb_path.replace('/', '__')[:-len('.ipynb')] + '.md')
+
+    if os.environ.get('UPDATE_GOLDEN'):
+        golden_file_path.write_text(output, encoding='utf-8')
+
+    assert output == golden_file_path.read_text(encoding='utf-8')
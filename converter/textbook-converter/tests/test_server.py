@@ -0,0 +1,53 @@
+"""Tests of the JSON-RPC server"""
+import io
+import json
+import os
+
+from textbook_converter.server import INVALID_PARAMS, ConverterServer
+
+from helpers import read_yaml, write_notebook, write_toc
+
+
+def request(server, id, method, params):
+    server.handle(json.dumps({'jsonrpc': '2.0', 'id': id, 'method': method, 'params': params}))
+    messages = [json.loads(line) for line in server.output.getvalue().splitlines()]
+    return next(message for message in messages if message.get('id') == id)
+
+
+def test_update_converts_changed_notebooks(tmp_path):
+    nb_path = tmp_path / 'notebooks'
+    output_path = tmp_path / 'output'
+    write_notebook(nb_path / 'basics/single.ipynb', 'Single', {'qubit': {'text': 'a qubit'}})
+    write_notebook(nb_path / 'basics/multiple.ipynb', 'Multiple', {'tensor': {'text': 'a product'}})
+    toc_path = write_toc(nb_path, ['single', 'multiple'])
+    server = ConverterServer([], io.StringIO())
+
+    response = request(server, 1, 'convert', {
+        'toc': str(toc_path), 'output': str(output_path), 'language': 'en', 'prune': True
+    })
+    assert response['result']['converted'] == 2
+    response = request(server, 2, 'update', {'output': str(output_path)})
+    assert response['result']['converted'] == 0
+
+    nb_file_path = nb_path / 'basics/single.ipynb'
+    write_notebook(nb_file_path, 'Single', {'state': {'text': 'a state'}})
+    mtime = nb_file_path.stat().st_mtime_ns + 10 ** 9
+    os.utime(nb_file_path, ns=(mtime, mtime))
+    response = request(server, 3, 'update', {'output': str(output_path), 'language': 'en'})
+
+    assert response['result'] == {
+        'language': 'en', 'seconds': response['result']['seconds'],
+        'converted': 1, 'cached': 0, 'failed': 0
+    }
+    assert set(read_yaml(output_path / 'shared/glossary.yaml')) == {'state', 'tensor'}
+
+
+def test_invalid_params(tmp_path):
+    server = ConverterServer([], io.StringIO())
+
+    response = request(server, 1, 'convert', {'toc': 'toc.yaml', 'jobs': 2})
+    assert response['error']['code'] == INVALID_PARAMS
+    response = request(server, 2, 'convert', {'toc': 'toc.yaml', 'split_outputs': 1000})
+    assert response['error'] == {'code': INVALID_PARAMS, 'message': '--split-outputs requires --assets'}
+    response = request(server, 3, 'update', {'output': str(tmp_path)})
+    assert response['error']['code'] == INVALID_PARAMS
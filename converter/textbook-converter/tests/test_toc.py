@@ -0,0 +1,77 @@
+"""Tests of the toc model"""
+import pytest
+
+from textbook_converter.toc import Toc
+
+
+def section(id, url, uuid=None):
+    return {'title': id, 'id': id, 'uuid': uuid or f'uuid-{id}', 'url': url}
+
+
+def test_chapters_and_sections_are_indexed():
+    toc = Toc([
+        {'title': 'Basics', 'url': '/basics', 'sections': [
+            section('single', '/basics/single'), section('multiple', 'basics/multiple')
+        ]},
+        {'title': 'Problems', 'url': '/problem-sets', 'sections': [
+            section('problems', '/problem-sets/problems')
+        ]}
+    ])
+
+    basics = toc.chapters_by_url['basics']
+    assert basics.get_order() == [('single', 'basics/single'), ('multiple', 'basics/multiple')]
+    assert basics.sections_by_id['multiple']['url'] == 'basics/multiple'
+    assert toc.sections_by_url['basics/single'] == (basics, basics.sections[0])
+    assert toc.chapters_by_url['problem-sets'].is_problem_set
+    assert not basics.is_problem_set
+    assert toc.find_chapter('/output/content/basics') is basics
+    assert toc.find_chapter('/output/content/other') is None
+
+
+@pytest.mark.parametrize('chapters, error', [
+    (
+        [
+            {'url': '/basics', 'sections': [section('single', '/basics/single')]},
+            {'url': 'basics', 'sections': []}
+        ],
+        'chapter url "/basics" is used 2 times'
+    ),
+    (
+        [{'url': '/basics', 'sections': [
+            section('single', '/basics/single'), section('single', '/basics/other')
+        ]}],
+        'section id "single" is used 2 times in "/basics"'
+    ),
+    (
+        [
+            {'url': '/basics', 'sections': []},
+            {'url': '/problem-sets', 'sections': [section('basics', '/problem-sets/basics')]}
+        ],
+        'problem set id "basics" is also a chapter url'
+    ),
+])
+def test_ids_overwriting_each_other_are_errors(chapters, error):
+    with pytest.raises(ValueError, match=error):
+        Toc(chapters)
+
+
+def test_duplicate_uuids_are_reported(capsys):
+    Toc([{'url': '/basics', 'sections': [
+        section('single', '/basics/single', 'uuid'), section('multiple', '/basics/multiple', 'uuid')
+    ]}])
+
+    assert capsys.readouterr().out == 'toc: uuid uuid is used by 2 sections\n'
+
+
+def test_load_parses_the_yaml_once(tmp_path):
+    toc_path = tmp_path / 'toc.yaml'
+    toc_path.write_text(
+        '- title: Basics\n  url: /basics\n  sections:\n'
+        '    - title: Single\n      id: single\n      uuid: 1\n      url: /basics/single\n',
+        encoding='utf-8'
+    )
+
+    toc = Toc.load(str(toc_path))
+    assert toc.file_path == str(toc_path.resolve())
+    assert toc.chapters[0].sections[0]['uuid'] == '1'
+    assert Toc.load(toc) is toc
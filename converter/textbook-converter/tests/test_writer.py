@@ -0,0 +1,73 @@
+"""Tests of the write-if-changed output writer"""
+import os
+
+import pytest
+
+from textbook_converter.writer import (
+    copy_file, count_changes, move_file, record_outputs, write_stream, write_text
+)
+
+
+def set_old_mtime(file_path):
+    os.utime(file_path, ns=(10 ** 9, 10 ** 9))
+
+
+def test_unchanged_files_are_not_written(tmp_path):
+    file_path = tmp_path / 'content.md'
+    with record_outputs() as outputs:
+        assert write_text(file_path, 'one')
+        set_old_mtime(file_path)
+        assert not write_text(file_path, 'one')
+
+    assert file_path.stat().st_mtime_ns == 10 ** 9
+    assert outputs == {str(file_path.resolve()): True}
+
+    with record_outputs() as outputs:
+        assert not write_text(file_path, 'one')
+        assert write_text(tmp_path / 'index.yaml', 'a: b')
+    assert count_changes(outputs) == (1, 1)
+
+    assert write_text(file_path, 'two')
+    assert file_path.read_text(encoding='utf-8') == 'two'
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['content.md', 'index.yaml']
+
+
+def test_nested_recordings_are_added_to_the_outer_one(tmp_path):
+    with record_outputs() as outer:
+        write_text(tmp_path / 'a.md', 'a')
+        with record_outputs() as inner:
+            write_text(tmp_path / 'b.md', 'b')
+
+    assert list(inner) == [str((tmp_path / 'b.md').resolve())]
+    assert sorted(outer) == [str((tmp_path / name).resolve()) for name in ('a.md', 'b.md')]
+
+
+def test_failed_stream_leaves_the_file_as_is(tmp_path):
+    file_path = tmp_path / 'content.md'
+    write_text(file_path, 'one')
+
+    def fragments():
+        yield 'two'
+        raise RuntimeError('cell failed')
+
+    with pytest.raises(RuntimeError):
+        write_stream(file_path, fragments())
+    assert file_path.read_text(encoding='utf-8') == 'one'
+    assert [path.name for path in tmp_path.iterdir()] == ['content.md']
+
+
+def test_copy_and_move_keep_unchanged_files(tmp_path):
+    src_path = tmp_path / 'src.png'
+    src_path.write_bytes(b'png')
+    file_path = tmp_path / 'images/dest.png'
+
+    assert copy_file(src_path, file_path)
+    set_old_mtime(file_path)
+    assert not copy_file(src_path, file_path)
+    assert file_path.stat().st_mtime_ns == 10 ** 9
+
+    moved_path = tmp_path / 'moved.png'
+    moved_path.write_bytes(b'png')
+    assert not move_file(moved_path, file_path)
+    assert not moved_path.exists()
+    assert file_path.stat().st_mtime_ns == 10 ** 9
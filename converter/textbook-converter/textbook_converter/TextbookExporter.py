@@ -1,6 +1,16 @@
+import base64
+import copy
+import hashlib
+import json
+import os
 import re
 
+from collections import OrderedDict
 from nbconvert.exporters import Exporter
+from traitlets import Bool
+
+from .filecache import FileCache, touch
+from .images import add_image_sizes, add_images, get_webp_variants, optimize_png
 
 
 INDENT = "    "
@@ -27,29 +37,16 @@ blank_regex = re.compile(r"\[\[(.+?)]]")
 
 inline_code_regex = re.compile(r"`(.+?)`")
 
+# tokens handled by the inline scanner, in a single pass over the line
+inline_token_regex = re.compile(
+    r"(?P<dollar>\$)|(?P<escape>\\[{}%])|`(?P<code>.+?)`|!\[(?P<alt>.*?)]\((?P<link>.+?)\)"
+)
+
 CODE_BLOCK_START = "```"
 
 
-JS_CLICK_GOAL = """
-    const {elt} = $section.$("{selector}");
-    if ({elt}) {{
-      {elt}.on("click", () => {{
-        $section.score("{id}");
-      }});
-    }}
-"""
-
-JS_VALUE_GOAL = """
-    const {elt} = $section.$("{selector}");
-    if ({elt}) {{
-      {elt}.on("change keyup input paste", (e) => {{
-        if ({elt}.value === "{value}" || ("{value}" === "checked" && {elt}.checked)) {{
-          e.preventDefault();
-          $section.score("{id}");
-        }}
-      }});
-    }}
-"""
+# step function scoring the goals of a cell, with the shared handler of `shared.ts`
+JS_GOALS = "export const {id} = shared.handleGoals({goals});\n"
 
 
 def handle_inline_images(line):
@@ -61,13 +58,10 @@ def handle_inline_images(line):
 
             <img src="path/image" alt="alt text">
     """
-    for match_alt, match_link in inline_markdown_img_regex.findall(line):
-        if match_link:
-            line = line.replace(
-                f'![{match_alt}]({match_link})',
-                f'<img src="{match_link}" alt="{match_alt}">'
-            )
-    return line
+    return inline_markdown_img_regex.sub(
+        lambda m: f'<img src="{m.group(2)}" alt="{m.group(1)}">',
+        line
+    )
 
 
 def handle_inline_code(line):
@@ -79,10 +73,13 @@ def handle_inline_code(line):
 
     `{code} some text`
     """
-    for match in inline_code_regex.findall(line):
-        if not match.startswith("{") and not match.startswith("`"):
-            line = line.replace(f"`{match}`", f"`{{code}} {match}`")
-    return line
+    def replace_code(match):
+        code = match.group(1)
+        if code.startswith("{") or code.startswith("`"):
+            return match.group(0)
+        return f"`{{code}} {code}`"
+
+    return inline_code_regex.sub(replace_code, line)
 
 def handle_inline_latex(line):
     """Escape \{ and \} in inline equations"""
@@ -99,6 +96,49 @@ def handle_inline_latex(line):
     return newline[:-1]
 
 
+def scan_inline(line, in_latex=False):
+    """Apply the inline conversions to a line in a single pass:
+
+    - escape \\{ and \\} in inline equations
+    - prefix inline code with `{code}`
+    - convert inline images to `<img>` tags
+    - escape \\%
+
+    Returns the converted line and whether the line ends in an inline equation.
+    """
+    if not ("$" in line or "\\" in line or "`" in line or "![" in line):
+        return line, in_latex
+
+    parts = []
+    position = 0
+    for match in inline_token_regex.finditer(line):
+        parts.append(line[position : match.start()])
+        position = match.end()
+        token = match.lastgroup
+
+        if token == "dollar":
+            parts.append("$")
+            in_latex = not in_latex
+        elif token == "escape":
+            if in_latex or match.group(0) == "\\%":
+                parts.append("\\")
+            parts.append(match.group(0))
+        elif token == "code":
+            code = match.group("code")
+            scanned_code, in_latex = scan_inline(code, in_latex)
+            if code.startswith("{") or code.startswith("`"):
+                parts.append(f"`{scanned_code}`")
+            else:
+                parts.append(f"`{{code}} {scanned_code}`")
+        else:
+            alt, in_latex = scan_inline(match.group("alt"), in_latex)
+            link, in_latex = scan_inline(match.group("link"), in_latex)
+            parts.append(f'<img src="{link}" alt="{alt}">')
+
+    parts.append(line[position:])
+    return "".join(parts), in_latex
+
+
 def handle_block_comment(comment_syntax):
     """Convert syntax from:
 
@@ -135,19 +175,77 @@ def handle_vue_component(vue_component_syntax):
         return vue_component_syntax
 
 
-def get_attachment_data(image_source, cell=None):
-    """Returns the data URI for the given image attachment"""
+def get_image_src(mime_type, data, resources=None):
+    """Returns the src for base64 encoded image data
+
+    By default this is a data URI. If `assets_dir` is set in the textbook
+    resources, the image is written once to that directory, named after
+    the hash of its content, and the src is its URL under `assets_url`.
+    With `optimize_images`, png images are losslessly recompressed first.
+    """
+    data = "".join(data)
+    textbook = resources["textbook"] if resources and "textbook" in resources else {}
+
+    optimize = textbook.get("optimize_images") and mime_type == "image/png"
+    if not textbook.get("assets_dir") and not optimize:
+        return f"data:{mime_type};base64,{data}"
+    return get_decoded_image_src(mime_type, decode_image(mime_type, data, textbook), textbook)
+
+
+def decode_image(mime_type, data, textbook):
+    """Returns the image of base64 encoded data, optimized with `optimize_images`"""
+    image = base64.b64decode(data)
+    if textbook.get("optimize_images") and mime_type == "image/png":
+        optimized = optimize_png(image, textbook.get("image_cache_dir"))
+        add_image_sizes(textbook, len(image), len(optimized))
+        image = optimized
+    return image
+
+
+def get_decoded_image_src(mime_type, image, textbook):
+    """Returns the data URI, or asset URL with `assets_dir`, of the image"""
+    if not textbook.get("assets_dir"):
+        return f"data:{mime_type};base64,{base64.b64encode(image).decode('ascii')}"
+
+    extension = mime_type.split("/", 1)[-1].split("+", 1)[0]
+    extension = "jpg" if extension == "jpeg" else extension
+    return write_asset(textbook, f"{hashlib.sha256(image).hexdigest()[:20]}.{extension}", image)
+
+
+def write_asset(textbook, file_name, data):
+    """Write the file (e.g. an image) to `assets_dir`, unless it exists, and return its URL"""
+    file_path = os.path.join(textbook["assets_dir"], file_name)
+
+    if not os.path.exists(file_path):
+        os.makedirs(textbook["assets_dir"], exist_ok=True)
+        # other notebooks (or processes) may write the same file
+        tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(tmp_file_path, "wb") as asset_file:
+            asset_file.write(data)
+        os.replace(tmp_file_path, file_path)
+
+    if "assets" not in textbook:
+        textbook["assets"] = []
+    if file_name not in textbook["assets"]:
+        textbook["assets"].append(file_name)
+
+    assets_url = textbook.get("assets_url") or "/assets"
+    return f"{assets_url.rstrip('/')}/{file_name}"
+
+
+def get_attachment_data(image_source, cell=None, resources=None):
+    """Returns the data URI (or asset URL) for the given image attachment"""
     if cell and image_source.startswith("attachment:"):
         img_data = cell["attachments"][image_source[len("attachment:") :]] or []
         for x in img_data.keys():
             if x.startswith("image/"):
-                img_data = f"data:{x};base64,{img_data[x]}"
+                img_data = get_image_src(x, img_data[x], resources)
                 break
         return img_data if len(img_data) else image_source
     return image_source
 
 
-def handle_attachments(line, cell):
+def handle_attachments(line, cell, resources=None):
     """Convert syntax from this:
 
     <img src="attachment:file.png">
@@ -160,13 +258,13 @@ def handle_attachments(line, cell):
     match = html_img_regex.search(line)
     if match is not None:
         img_src = match.group(2)
-        img_data = get_attachment_data(img_src, cell)
+        img_data = get_attachment_data(img_src, cell, resources)
         return line.replace(img_src, img_data)
     else:
         return line
 
 
-def handle_images(line, cell):
+def handle_images(line, cell, resources=None):
     """Convert syntax from this:
 
     ![alt text](path/image)
@@ -179,7 +277,7 @@ def handle_images(line, cell):
     match = markdown_img_regex.search(line.lstrip())
     if match is not None:
         return f"""
-    figure: x-img(src="{get_attachment_data(match.group(1), cell)}")
+    figure: x-img(src="{get_attachment_data(match.group(1), cell, resources)}")
         """
     else:
         return line
@@ -241,13 +339,18 @@ def handle_heading(heading_syntax, in_block, suffix, section, is_problem_set=Fal
 
 
 def handle_markdown_cell(cell, resources, cell_number, is_problem_set=False):
-    """Reformat code markdown"""
+    """Reformat code markdown
+
+    Each line is classified once from its first non-blank characters, and
+    text lines go through `scan_inline`.
+    """
     markdown_lines = []
     lines = cell.source.splitlines()
     in_latex = False
     in_block = False
     in_code = False
     headings = []
+    has_attachments = "attachments" in cell
 
     for count, line in enumerate(lines):
         if in_latex:
@@ -259,9 +362,11 @@ def handle_markdown_cell(cell, resources, cell_number, is_problem_set=False):
             else:
                 markdown_lines.append(line)
                 markdown_lines.append("\n")
-                in_latex = True
             continue
-        if line.lstrip().startswith("$$"):
+
+        stripped = line.lstrip()
+
+        if stripped.startswith("$$"):
             indent, l = line.split("$$", 1)
             assert not indent or indent.isspace()
             markdown_lines.append(f"{indent}```latex\n")
@@ -269,43 +374,40 @@ def handle_markdown_cell(cell, resources, cell_number, is_problem_set=False):
                 l = l.replace("$$", "")
                 markdown_lines.append(f"{indent}{l}\n" if len(l) else l)
                 markdown_lines.append(f"{indent}```\n")
-                in_latex = False
             else:
                 markdown_lines.append(f"{indent}{l}\n" if len(l) else l)
                 in_latex = True
             continue
 
-        if in_code:
-            if line.lstrip().startswith(CODE_BLOCK_START):
-                in_code = False
-                markdown_lines.append(line + "\n")
-            else:
-                markdown_lines.append(line + "\n")
-            continue
-        elif line.lstrip().startswith(CODE_BLOCK_START):
-            in_code = True
-            if line.rstrip().endswith(CODE_BLOCK_START):
+        if stripped.startswith(CODE_BLOCK_START):
+            if not in_code and line.rstrip().endswith(CODE_BLOCK_START):
                 markdown_lines.append(line.rstrip() + "code\n")
             else:
                 markdown_lines.append(line + "\n")
+            in_code = not in_code
+            continue
+        elif in_code:
+            markdown_lines.append(line + "\n")
             continue
 
-        line = handle_attachments(line, cell)
+        if has_attachments and "attachment:" in line:
+            line = handle_attachments(line, cell, resources)
 
-        if line.lstrip().startswith(COMMENT_START):
+        first = stripped[:1]
+        if first == "<" and stripped.startswith(COMMENT_START):
             l = handle_block_comment(line)
             if l.strip().endswith(":::"):
                 in_block = False
             elif l.strip().startswith(":::"):
                 in_block = True
             markdown_lines.append(l)
-        elif line.lstrip().startswith(HERO_IMAGE_START):
+        elif first == "!" and stripped.startswith(HERO_IMAGE_START):
             markdown_lines.append(handle_hero_image(line))
-        elif line.lstrip().startswith(VUE_COMPONENT_START):
+        elif first == "!" and stripped.startswith(VUE_COMPONENT_START):
             markdown_lines.append(handle_vue_component(line))
-        elif line.lstrip().startswith(IMAGE_START):
-            markdown_lines.append(handle_images(line, cell))
-        elif line.lstrip().startswith(HEADING_START):
+        elif first == "!" and stripped.startswith(IMAGE_START):
+            markdown_lines.append(handle_images(line, cell, resources))
+        elif first == HEADING_START:
             section = (
                 resources["textbook"]["section"]
                 if "section" in resources["textbook"]
@@ -318,12 +420,8 @@ def handle_markdown_cell(cell, resources, cell_number, is_problem_set=False):
                 headings.append((id, level, title))
             markdown_lines.append(heading_text)
         else:
-            line = handle_inline_latex(line)
-            line = handle_inline_code(line)
-            line = handle_inline_images(line)
-            markdown_lines.append(
-                line.replace("\\%", "\\\\%")
-            )  # .replace('$$', '$').replace('\\', '\\\\'))
+            line, _ = scan_inline(line)
+            markdown_lines.append(line)
             markdown_lines.append("\n")
 
     markdown_lines.append("\n")
@@ -331,25 +429,205 @@ def handle_markdown_cell(cell, resources, cell_number, is_problem_set=False):
     return updated_lines, resources, headings
 
 
-def handle_code_cell_output(cell_output):
+# elements whose content is left as is when minifying
+preformatted_regex = re.compile(
+    r"<(pre|textarea|script|style|text)\b.*?</\1\s*>", re.DOTALL | re.IGNORECASE
+)
+markup_comment_regex = re.compile(r"<!--(?!\[).*?-->", re.DOTALL)
+svg_prolog_regex = re.compile(
+    r"<\?xml.*?\?>|<!DOCTYPE[^>]*>|<metadata\b.*?</metadata>", re.DOTALL | re.IGNORECASE
+)
+svg_tag_space_regex = re.compile(r">\s+<")
+line_space_regex = re.compile(r"\s*\n\s*")
+
+
+def minify_markup_part(text, is_svg):
+    text = markup_comment_regex.sub("", text)
+    if is_svg:
+        # whitespace between svg elements (outside of <text>) is not rendered
+        text = svg_tag_space_regex.sub("><", text).strip()
+    return line_space_regex.sub(" ", text)
+
+
+def minify_markup(text, is_svg=False):
+    """Remove comments and line breaks from html or svg output
+
+    Line breaks render like spaces, except in preformatted elements (and
+    svg text), which are left as is. The xml prolog, doctype and metadata
+    of svg are removed too.
+    """
+    if is_svg:
+        text = svg_prolog_regex.sub("", text)
+        if "xml:space" in text:
+            return text.strip()
+    parts = []
+    start = 0
+    for match in preformatted_regex.finditer(text):
+        parts.append(minify_markup_part(text[start:match.start()], is_svg))
+        parts.append(match.group(0))
+        start = match.end()
+    parts.append(minify_markup_part(text[start:], is_svg))
+    return "".join(parts).strip()
+
+
+def get_minified_output(mime_type, text, cache_dir=None):
+    """Return the minified html or svg output, minifying each distinct output once
+
+    Minified outputs are kept in memory, and in `cache_dir` (by the hash of
+    the output) for other processes and builds.
+    """
+    key = hashlib.sha256(f"{mime_type}\n{text}".encode("utf-8")).hexdigest()
+    fragment = minified_outputs.get(key)
+    if fragment is None:
+        cache = FileCache(cache_dir)
+        minified = cache.get(key, ".html")
+        if minified is None:
+            minified = minify_markup(text, is_svg="svg" in mime_type).encode("utf-8")
+            cache.put(key, ".html", minified)
+        fragment = (minified.decode("utf-8"),)
+        minified_outputs.put(key, fragment)
+    return fragment[0]
+
+
+svg_start_regex = re.compile(r"<svg\b[^>]*>", re.IGNORECASE)
+svg_tag_regex = re.compile(r"<(/?)svg\b", re.IGNORECASE)
+svg_id_regex = re.compile(r'\sid="([^"]*)"')
+svg_use_regex = re.compile(r'<svg\b[^>]*><use href="#o-')
+
+
+def find_svg_elements(text):
+    """Return the start and end of each top level `<svg>` element in the text"""
+    elements = []
+    depth = 0
+    start = None
+    for match in svg_tag_regex.finditer(text):
+        if not match.group(1):
+            start_tag = svg_start_regex.match(text, match.start())
+            if start_tag is None or start_tag.group(0).endswith("/>"):
+                continue
+            if depth == 0:
+                start = match.start()
+            depth += 1
+        elif depth > 0:
+            depth -= 1
+            if depth == 0:
+                end = text.find(">", match.end())
+                if end < 0:
+                    break
+                elements.append((start, end + 1))
+    return elements
+
+
+def dedupe_svg_outputs(text, seen):
+    """Replace the svg elements already in the page with a reference to the first one
+
+    Each svg gets an id derived from its content, and an svg already in
+    `seen` is replaced by an svg of the same size that `<use>`s it. Ids
+    are added to `seen`. Svgs with an id of their own are left as is.
+    """
+    if "<svg" not in text:
+        return text
+    parts = []
+    last = 0
+    for start, end in find_svg_elements(text):
+        svg = text[start:end]
+        if svg_use_regex.match(svg):
+            continue
+        start_tag = svg_start_regex.match(svg).group(0)
+        match = svg_id_regex.search(start_tag)
+        if not match:
+            svg_id = f"o-{hashlib.sha256(svg.encode('utf-8')).hexdigest()[:16]}"
+            svg = f'<svg id="{svg_id}"{svg[4:]}'
+        elif match.group(1).startswith("o-"):
+            # deduplicated before, e.g. in the markdown of another section
+            svg_id = match.group(1)
+        else:
+            continue
+        if svg_id in seen:
+            attributes = svg_id_regex.sub("", start_tag[4:-1])
+            svg = f'<svg{attributes}><use href="#{svg_id}" width="100%" height="100%"/></svg>'
+        else:
+            seen.add(svg_id)
+        parts.append(text[last:start])
+        parts.append(svg)
+        last = end
+    parts.append(text[last:])
+    return "".join(parts)
+
+
+def get_image_tag(mime_type, data, resources=None):
+    """Returns the `<img>` for base64 encoded image data
+
+    With `webp` and `assets_dir` set in the textbook resources, png images
+    are in a `<picture>` with lossless webp variants of several widths.
+    """
+    textbook = resources["textbook"] if resources and "textbook" in resources else {}
+    if not (textbook.get("webp") and textbook.get("assets_dir") and mime_type == "image/png"):
+        return f'<img src="{get_image_src(mime_type, data, resources)}"/>'
+
+    image = decode_image(mime_type, "".join(data), textbook)
+    src = get_decoded_image_src(mime_type, image, textbook)
+    variants = get_webp_variants(image, textbook.get("image_cache_dir"))
+    if not variants:
+        return f'<img src="{src}"/>'
+
+    name = hashlib.sha256(image).hexdigest()[:20]
+    width = variants[0][0]
+    srcset = ", ".join(
+        f"{write_asset(textbook, f'{name}-{w}.webp', webp)} {w}w" for w, webp in reversed(variants)
+    )
+    return (
+        f'<picture><source type="image/webp" srcset="{srcset}" '
+        f'sizes="(max-width: {width}px) 100vw, {width}px"/><img src="{src}"/></picture>'
+    )
+
+
+def get_text_output(text, resources=None):
+    """Returns the `pre` block of a text output
+
+    With `split_outputs_size` and `assets_dir` set in the textbook resources,
+    outputs larger than `split_outputs_size` bytes are written to an asset file
+    instead, and replaced by a collapsed `details` element that loads them
+    when opened (see `notebooks/shared/shared.ts`).
+    """
+    textbook = resources["textbook"] if resources and "textbook" in resources else {}
+    data = text.encode("utf-8")
+    if not (textbook.get("split_outputs_size") and textbook.get("assets_dir")) or (
+        len(data) <= textbook["split_outputs_size"]
+    ):
+        return f"pre \n{INDENT}| " + text.replace("\n", f"\n{INDENT}| ")
+
+    file_name = f"{hashlib.sha256(data).hexdigest()[:20]}.txt"
+    src = write_asset(textbook, file_name, data)
+    lines = text.count("\n") + (not text.endswith("\n"))
+    textbook.setdefault("split_outputs", []).append((file_name, lines, len(data)))
+    return (
+        f'<details class="lazy-output" data-src="{src}">'
+        f"<summary>Show output ({lines} lines, {len(data) / 1024:.0f} KiB)</summary>"
+        f"<pre></pre></details>"
+    )
+
+
+def handle_code_cell_output(cell_output, resources=None):
+    output_cache_dir = (resources or {}).get("textbook", {}).get("output_cache_dir")
     if "data" in cell_output:
         for k, v in cell_output["data"].items():
             if "image/svg+xml" in k:
-                return "".join(cell_output["data"]["image/svg+xml"])
+                return get_minified_output(
+                    k, "".join(cell_output["data"]["image/svg+xml"]), output_cache_dir
+                )
             elif "image/" in k:
-                return f'<img src="data:{k};base64,{v}"/>'
+                return get_image_tag(k, v, resources)
         if "text/html" in cell_output["data"]:
-            return "".join(cell_output["data"]["text/html"])
+            return get_minified_output(
+                "text/html", "".join(cell_output["data"]["text/html"]), output_cache_dir
+            )
         if "text/latex" in cell_output["data"]:
             return "".join(cell_output["data"]["text/latex"]).strip().replace("$$", "")
         elif "text/plain" in cell_output["data"]:
-            return f"pre \n{INDENT}| " + "".join(
-                cell_output["data"]["text/plain"]
-            ).replace("\n", f"\n{INDENT}| ")
+            return get_text_output("".join(cell_output["data"]["text/plain"]), resources)
     elif "text" in cell_output:
-        return f"pre \n{INDENT}| " + "".join(cell_output["text"]).replace(
-            "\n", f"\n{INDENT}| "
-        )
+        return get_text_output("".join(cell_output["text"]), resources)
 
     return None
 
@@ -414,7 +692,7 @@ def handle_code_cell(cell, resources):
         code_lines.append(f'\n    output\n')
         for cell_output in cell.outputs:
             is_latex = "data" in cell_output and "text/latex" in cell_output["data"]
-            output = handle_code_cell_output(cell_output) or ""
+            output = handle_code_cell_output(cell_output, resources) or ""
             if output.startswith("pre"):
                 output = f"{INDENT * 2}" + output.replace("\n", f"\n{INDENT * 2}")
                 code_lines.append(f"{output}\n\n")
@@ -467,45 +745,44 @@ def handle_cell_formulas(cell, resources={}):
 
 
 def handle_cell_goals(id, cell, resources={}):
-    """Convert 'goals' dictionary to javascript function (string)"""
-    goals = set([])
+    """Convert 'goals' dictionary to a step function (string) of a table of the goal events
+
+    Goals without `click` or `value` (scored by components) need no step
+    function. Each event has the selector of the element, the event (`click` or
+    `value`), the expected value and the goal id. The events are handled by
+    `handleGoals` in `notebooks/shared/shared.ts`.
+    """
+    goals = []
 
     if "goals" in cell.metadata and cell.metadata["goals"]:
-        goals_meta = cell.metadata["goals"]
-        actions = [f"export function {id}($section: Step) {{ "]
-        actions.append("  setTimeout(() => {")
+        events = []
 
-        for count, goal in enumerate(goals_meta):
+        for goal in cell.metadata["goals"]:
             if "click" in goal:
-                actions.append(
-                    JS_CLICK_GOAL.format(
-                        elt="elt" + str(count), selector=goal["selector"], id=goal["id"]
-                    )
-                )
+                events.append({"selector": goal["selector"], "event": "click", "goal": goal["id"]})
 
             if "value" in goal:
-                actions.append(
-                    JS_VALUE_GOAL.format(
-                        elt="elt" + str(count),
-                        selector=goal["selector"],
-                        id=goal["id"],
-                        value=goal["value"],
-                    )
-                )
-
-            goals.add(goal["id"])
-
-        actions.append("  }, 250);")
-        actions.append("}\n")
-
-        if "textbook" not in resources:
-            resources["textbook"] = {}
-        if "functions" not in resources["textbook"]:
-            resources["textbook"]["functions"] = ""
-
-        resources["textbook"]["functions"] += "\n".join(actions)
+                events.append({
+                    "selector": goal["selector"],
+                    "event": "value",
+                    "value": str(goal["value"]),
+                    "goal": goal["id"],
+                })
+
+            if goal["id"] not in goals:
+                goals.append(goal["id"])
+
+        if events:
+            if "textbook" not in resources:
+                resources["textbook"] = {}
+            if "functions" not in resources["textbook"]:
+                resources["textbook"]["functions"] = ""
+
+            resources["textbook"]["functions"] += JS_GOALS.format(
+                id=id, goals=json.dumps(events, separators=(",", ":"))
+            )
 
-    return list(goals), resources
+    return goals, resources
 
 
 def handle_index(headers, resources={}):
@@ -537,16 +814,190 @@ def handle_index(headers, resources={}):
     return index, resources
 
 
+# textbook resources gathered from the cells, all others configure the rendering
+CELL_RESOURCES = (
+    "glossary", "formulas", "functions", "assets", "index", "images", "split_outputs"
+)
+
+
+class CellCache:
+    """Rendered cell fragments, keyed by everything their rendering depends on
+
+    The least recently used fragments are dropped when the fragments add up
+    to more than `max_size` characters.
+    """
+
+    def __init__(self, max_size=64 * 1024 * 1024):
+        self.fragments = OrderedDict()
+        self.max_size = max_size
+        self.size = 0
+
+    def get(self, key):
+        fragment = self.fragments.get(key)
+        if fragment is not None:
+            self.fragments.move_to_end(key)
+        return fragment
+
+    def put(self, key, fragment):
+        if key in self.fragments:
+            return
+        self.fragments[key] = fragment
+        self.size += len(fragment[0])
+        while self.size > self.max_size and len(self.fragments) > 1:
+            _, dropped = self.fragments.popitem(last=False)
+            self.size -= len(dropped[0])
+
+    def clear(self):
+        self.fragments.clear()
+        self.size = 0
+
+
+# minified outputs, by mime type and content, shared by all notebooks in the process
+minified_outputs = CellCache(16 * 1024 * 1024)
+
+
+def get_cell_key(cell, count, id, goals, textbook, is_problem_set):
+    """Return the cache key of a cell rendering"""
+    config = {k: v for k, v in textbook.items() if k not in CELL_RESOURCES}
+    key = json.dumps(
+        [cell, count, id, bool(goals), is_problem_set, config],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+# textbook resources that identify the notebook, code cells render the same without them
+NOTEBOOK_RESOURCES = (
+    "id", "section", "is_problem_set", "fragments_dir", "image_cache_dir", "output_cache_dir"
+)
+
+
+# code cell metadata used by `handle_code_cell`
+CODE_CELL_METADATA = (
+    "include_output",
+    "grader_import",
+    "grader_function",
+    "grader_id",
+    "grader_answer",
+    "goals",
+)
+
+
+class FragmentStore:
+    """Rendered code cells on disk, shared by processes and languages
+
+    Translated notebooks mostly keep the code cells and outputs of the
+    English notebooks, so their code blocks are rendered once. Each fragment
+    is a json file with the markdown and the asset files it references.
+    Fragments are marked as used when read, so that the directory can be
+    pruned of the least recently used (see `filecache.prune_cache_dir`).
+    """
+
+    def __init__(self, fragments_dir):
+        self.fragments_dir = fragments_dir
+
+    def get_path(self, key):
+        return os.path.join(self.fragments_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        fragment_path = self.get_path(key)
+        try:
+            with open(fragment_path, encoding="utf-8") as fragment_file:
+                fragment = json.load(fragment_file)
+        except (OSError, ValueError):
+            return None
+        touch(fragment_path)
+        return fragment
+
+    def put(self, key, fragment):
+        fragment_path = self.get_path(key)
+        os.makedirs(os.path.dirname(fragment_path), exist_ok=True)
+        tmp_path = f"{fragment_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fragment_file:
+            json.dump(fragment, fragment_file)
+        os.replace(tmp_path, fragment_path)
+
+
+def get_code_cell_key(cell, textbook):
+    """Return the fragment store key of a code cell: its source, metadata, outputs and config"""
+    config = {
+        k: v for k, v in textbook.items()
+        if k not in CELL_RESOURCES and k not in NOTEBOOK_RESOURCES
+    }
+    metadata = {k: v for k, v in cell.metadata.items() if k in CODE_CELL_METADATA}
+    key = json.dumps(
+        [cell.source, metadata, cell.outputs, config],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def replace_first(fragments, old, new):
+    """Replace the first occurrence of `old` in a stream of text fragments
+
+    Up to `len(old) - 1` characters are held back until the next fragment,
+    so an occurrence spanning fragments is also found.
+    """
+    carry = ""
+    keep = len(old) - 1
+    fragments = iter(fragments)
+    for fragment in fragments:
+        text = carry + fragment
+        index = text.find(old)
+        if index >= 0:
+            yield text[:index] + new + text[index + len(old):]
+            yield from fragments
+            return
+        if len(text) > keep:
+            yield text[: len(text) - keep]
+            carry = text[len(text) - keep:]
+        else:
+            carry = text
+    yield carry
+
+
 class TextbookExporter(Exporter):
     output_mimetype = "text/markdown"
 
+    # shared by all exporters in the process, set to None to disable
+    cell_cache = CellCache()
+
+    read_only = Bool(
+        False,
+        help="Render the cells of the notebook itself, instead of a deep copy, "
+        "when no preprocessors are enabled. The notebook is not modified.",
+    ).tag(config=True)
+
     def _file_extension_default(self):
         return ".md"
 
+    def _init_read_only(self, nb, resources):
+        """Prepare the resources like `Exporter.from_notebook_node`, without copying nb"""
+        resources = self._init_resources(copy.deepcopy(resources))
+        if "language" in nb["metadata"]:
+            resources["language"] = nb["metadata"]["language"].lower()
+        return nb, resources
+
     def from_notebook_node(self, nb, resources=None, **kw):
-        nb_copy, resources = super().from_notebook_node(nb, resources)
+        fragments, resources = self.stream_notebook_node(nb, resources, **kw)
+        return ("".join(fragments), resources)
+
+    def stream_notebook_node(self, nb, resources=None, **kw):
+        """Return the markdown as a generator of fragments, one per cell, and the resources
+
+        The glossary, formulas, functions and index are added to the
+        resources as the fragments are generated, they are complete once the
+        generator is exhausted.
+        """
+        # nbconvert registers its default preprocessors, disabled unless configured
+        preprocessors = [p for p in self._preprocessors if getattr(p, "enabled", True)]
+        if self.read_only and not preprocessors:
+            nb_copy, resources = self._init_read_only(nb, resources)
+        else:
+            nb_copy, resources = super().from_notebook_node(nb, resources)
 
-        markdown_lines = []
         prefix = ""
         is_problem_set = False
 
@@ -558,50 +1009,174 @@ class TextbookExporter(Exporter):
         if "is_problem_set" in resources["textbook"]:
             is_problem_set = resources["textbook"]["is_problem_set"] 
 
+        fragments = self._generate_fragments(nb_copy, resources, prefix, is_problem_set)
+        if is_problem_set:
+            fragments = replace_first(fragments, "\n---\n\n>", "\n\n>")
+        return (fragments, resources)
+
+    def _generate_fragments(self, nb_copy, resources, prefix, is_problem_set):
         nb_headings = []
+        goals = None
+        svg_ids = set()
         for count, cell in enumerate(nb_copy.cells):
             id = prefix + str(count)
-            if cell.cell_type == "markdown":
-                resources = handle_cell_glossary(cell, resources)
-                resources = handle_cell_formulas(cell, resources)
-
-                blanks = blank_regex.findall(cell.source)
-                if not len(blanks):
-                    goals, resources = handle_cell_goals(id, cell, resources)
-                    if goals:
-                        markdown_lines.append(f"\n---\n> id: {id}")
-                        markdown_lines.append(f'\n> goals: {" ".join(goals)}\n\n')
-                else:
-                    markdown_lines.append(f"\n---\n> id: {id}\n\n")
-
-                markdown_output, resources, headings = handle_markdown_cell(
-                    cell, resources, count, is_problem_set=is_problem_set
-                )
-                markdown_lines.append(markdown_output)
-
-                if goals or len(blanks):
-                    markdown_lines.append(f"\n\n---\n")
-                if headings:
-                    nb_headings += headings
+            if cell.cell_type == "code" and (
+                not cell.source.strip()
+                or ('tags' in cell.metadata and 'sanity-check' in cell.metadata['tags'])
+            ):
+                # Ignore cell
                 continue
 
-            if cell.cell_type == "code" and cell.source.strip():
-                if 'tags' in cell.metadata and 'sanity-check' in cell.metadata['tags']:
-                    # Ignore cell
-                    continue
+            text, headings, goals = self.render_cell(
+                cell, count, id, goals, resources, is_problem_set
+            )
+            if cell.cell_type == "code":
+                text = dedupe_svg_outputs(text, svg_ids)
+            yield text
+            if headings:
+                nb_headings += headings
+
+        if nb_headings:
+            handle_index(nb_headings, resources)
+
+        yield "\n"
+
+    def render_cell(self, cell, count, id, goals, resources, is_problem_set=False):
+        """Render a markdown or code cell
+
+        Returns the markdown, the headings and the goals of the cell (markdown
+        cells with blanks keep the goals of the previous cell). The glossary,
+        formulas, functions and assets of the cell are added to `resources`.
+        Renderings are looked up in `cell_cache` first.
+        """
+        textbook = resources["textbook"]
+        key = None
+        fragment = None
+
+        if self.cell_cache is not None:
+            key = get_cell_key(cell, count, id, goals, textbook, is_problem_set)
+            fragment = self.cell_cache.get(key)
+            if fragment is not None and textbook.get("assets_dir"):
+                assets = fragment[3].get("assets", [])
+                if not all(
+                    os.path.exists(os.path.join(textbook["assets_dir"], a)) for a in assets
+                ):
+                    fragment = None
+
+        if fragment is None:
+            cell_resources = {
+                "textbook": {k: v for k, v in textbook.items() if k not in CELL_RESOURCES}
+            }
+            text, headings, goals = self._render_cell(
+                cell, count, id, goals, cell_resources, is_problem_set
+            )
+            contributions = {
+                k: v for k, v in cell_resources["textbook"].items() if k in CELL_RESOURCES
+            }
+            fragment = (text, headings, goals, contributions)
+            if key is not None:
+                self.cell_cache.put(key, fragment)
+
+        text, headings, goals, contributions = fragment
+
+        for k in ("glossary", "formulas"):
+            if k in contributions:
+                textbook[k] = {**textbook.get(k, {}), **contributions[k]}
+        if "functions" in contributions:
+            textbook["functions"] = textbook.get("functions", "") + contributions["functions"]
+        if "assets" in contributions:
+            assets = textbook.setdefault("assets", [])
+            assets += [a for a in contributions["assets"] if a not in assets]
+        if "images" in contributions:
+            add_images(textbook, contributions["images"])
+        if "split_outputs" in contributions:
+            textbook.setdefault("split_outputs", []).extend(
+                contributions["split_outputs"]
+            )
+
+        return text, list(headings), goals
+
+    def _render_cell(self, cell, count, id, goals, resources, is_problem_set=False):
+        markdown_lines = []
+        headings = []
+
+        if cell.cell_type == "markdown":
+            resources = handle_cell_glossary(cell, resources)
+            resources = handle_cell_formulas(cell, resources)
+
+            blanks = blank_regex.findall(cell.source)
+            if not len(blanks):
                 goals, resources = handle_cell_goals(id, cell, resources)
                 if goals:
                     markdown_lines.append(f"\n---\n> id: {id}")
                     markdown_lines.append(f'\n> goals: {" ".join(goals)}\n\n')
-                code_output, resources = handle_code_cell(cell, resources)
-                markdown_lines.append(code_output)
+            else:
+                markdown_lines.append(f"\n---\n> id: {id}\n\n")
 
-        if nb_headings:
-            _, resources = handle_index(nb_headings, resources)
+            markdown_output, resources, headings = handle_markdown_cell(
+                cell, resources, count, is_problem_set=is_problem_set
+            )
+            markdown_lines.append(markdown_output)
 
-        markdown_lines.append("\n")
+            if goals or len(blanks):
+                markdown_lines.append(f"\n\n---\n")
 
-        full_text = "".join(markdown_lines)
-        if is_problem_set:
-            full_text = full_text.replace("\n---\n\n>", "\n\n>", 1)
-        return (full_text, resources)
+        elif cell.cell_type == "code":
+            goals, resources = handle_cell_goals(id, cell, resources)
+            if goals:
+                markdown_lines.append(f"\n---\n> id: {id}")
+                markdown_lines.append(f'\n> goals: {" ".join(goals)}\n\n')
+            code_output, resources = self.render_code_cell(cell, resources)
+            markdown_lines.append(code_output)
+
+        return "".join(markdown_lines), headings, goals
+
+    def render_code_cell(self, cell, resources):
+        """Render the code cell with `handle_code_cell`, or reuse it from the fragment store
+
+        The store is used when the `textbook` resources set `fragments_dir`.
+        """
+        textbook = resources["textbook"]
+        if not textbook.get("fragments_dir"):
+            return handle_code_cell(cell, resources)
+
+        store = FragmentStore(textbook["fragments_dir"])
+        key = get_code_cell_key(cell, textbook)
+        fragment = store.get(key)
+        if fragment is not None and textbook.get("assets_dir") and not all(
+            os.path.exists(os.path.join(textbook["assets_dir"], a)) for a in fragment["assets"]
+        ):
+            fragment = None
+
+        if fragment is None:
+            assets = list(textbook.get("assets", []))
+            images = textbook.pop("images", None)
+            split_outputs = textbook.pop("split_outputs", None)
+            code_output, resources = handle_code_cell(cell, resources)
+            fragment = {
+                "text": code_output,
+                "assets": [a for a in textbook.get("assets", []) if a not in assets],
+            }
+            if "images" in textbook:
+                fragment["images"] = textbook["images"]
+            if images:
+                add_images(textbook, images)
+            if "split_outputs" in textbook:
+                fragment["split_outputs"] = textbook["split_outputs"]
+            if split_outputs:
+                textbook["split_outputs"] = split_outputs + textbook.get(
+                    "split_outputs", []
+                )
+            store.put(key, fragment)
+        else:
+            if fragment["assets"]:
+                assets = textbook.setdefault("assets", [])
+                assets += [a for a in fragment["assets"] if a not in assets]
+            if "images" in fragment:
+                add_images(textbook, fragment["images"])
+            if "split_outputs" in fragment:
+                textbook.setdefault("split_outputs", []).extend(
+                    tuple(output) for output in fragment["split_outputs"]
+                )
+
+        return fragment["text"], resources
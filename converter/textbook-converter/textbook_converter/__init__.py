@@ -1,2 +1,4 @@
+__version__ = '0.1.0'
+
 from .TextbookExporter import TextbookExporter, mathigon_ximg_regex, html_img_regex
 from .converter import *
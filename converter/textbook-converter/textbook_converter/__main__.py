@@ -4,7 +4,10 @@ import sys
 
 from pathlib import Path
 
-from .converter import convert, merge, standalone, yml_to_dict
+from .converter import convert_batch, convert_toc, get_options
+from .server import serve
+from .trace import start_trace, stop_trace
+from .watcher import TocWatcher
 
 
 parser = argparse.ArgumentParser(
@@ -12,38 +15,108 @@ parser = argparse.ArgumentParser(
     description='Convert notebook to Mathigon markdown'
 )
 
-parser.add_argument('toc_file', nargs=1, type=str, help='path to toc yaml')
+parser.add_argument('toc_file', nargs='?', type=str, help='path to toc yaml')
 parser.add_argument('-n', '--notebooks', nargs=1, type=str, help='directory where notebooks are located')
 parser.add_argument('-o', '--output', nargs=1, type=str, help='directory to store converted notebook')
+parser.add_argument('-j', '--jobs', nargs='?', type=int, const=os.cpu_count(), default=1, help='number of notebooks to convert in parallel (default: 1, or number of CPUs if no value)')
+parser.add_argument('-c', '--cache', nargs=1, type=str, help='directory to cache converted sections between builds')
+parser.add_argument('--plan', action='store_true', help='print which sections would be rebuilt and exit')
+parser.add_argument('-a', '--assets', nargs=1, type=str, help='directory to write images to, instead of inlining them as data URIs')
+parser.add_argument('--assets-url', nargs=1, type=str, help='URL of the assets directory in the converted pages (default: /assets)')
+parser.add_argument('--copy-assets', action='store_true', help='copy the images and resources referenced by the converted pages from the notebooks directory to the output')
+parser.add_argument('--prune', action='store_true', help='delete the files of the output directory the conversion did not write, e.g. of removed or renamed notebooks')
+parser.add_argument('--optimize-images', action='store_true', help='losslessly recompress png images (requires Pillow)')
+parser.add_argument('--webp', action='store_true', help='add lossless webp variants of several widths to png outputs written to --assets (requires Pillow)')
+parser.add_argument('--split-outputs', nargs=1, type=int, metavar='SIZE', help='write text outputs larger than SIZE bytes to --assets, and load them when the reader opens them')
+parser.add_argument('-f', '--fragments', nargs=1, type=str, help='directory to store rendered code cells in, to reuse them across notebooks and languages (default with --language and --cache: CACHE/fragments)')
+parser.add_argument('-w', '--watch', action='store_true', help='convert, then reconvert notebooks as they change')
+parser.add_argument('--trace', nargs=1, type=str, help='write the time and memory of each conversion phase to a Chrome trace JSON file')
+parser.add_argument('-l', '--language', nargs=4, action='append', metavar=('LANG', 'TOC', 'NOTEBOOKS', 'OUTPUT'), help='convert the toc of a language, can be repeated to convert several languages in one pool of processes (instead of toc_file)')
+parser.add_argument('--shared', nargs=1, type=str, help='shared directory for notebooks without one (default with --language: shared directory of en)')
+parser.add_argument('--serve', action='store_true', help='serve JSON-RPC conversion requests from stdin, one per line')
 
-args = parser.parse_args()
-
-toc_file_path = args.toc_file[0]
-notebooks_dir = args.notebooks[0] if args.notebooks else None
-output_dir = args.output[0] if args.output else None
-
-toc_chapters = yml_to_dict(toc_file_path)
-nb_dir_path = Path(toc_file_path).parent if notebooks_dir is None else Path(notebooks_dir)
-output_path = output_dir or nb_dir_path
-shared_dir = os.path.join(output_path, 'shared')
-
-for chapter in toc_chapters:
-    is_problem_set = chapter['url'].startswith('/problem-sets')
-    chapter_url = chapter['url'][1:] if chapter['url'].startswith('/') else chapter['url']
-    chapter_output = os.path.join(output_path, chapter_url)
-
-    if len(chapter['sections']):
-        for section in chapter['sections']:
-            section_url = section['url'][1:] if section['url'].startswith('/') else section['url']
-            convert(
-                os.path.join(nb_dir_path, section_url) + '.ipynb',
-                output_dir=chapter_output,
-                shared_dir=shared_dir,
-                section_id=section['id'],
-                is_problem_set=is_problem_set
-            )
-            if is_problem_set:
-                standalone(chapter_output, section)
-
-        if not is_problem_set:
-            merge(chapter_output, toc_file_path)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    if args.plan and (args.language or args.watch or args.serve):
+        parser.error('--plan cannot be combined with --language, --watch or --serve')
+    if args.prune and args.plan:
+        parser.error('--prune cannot be combined with --plan')
+    if args.serve:
+        serve(jobs=args.jobs)
+        sys.exit()
+    if args.toc_file is None and not args.language:
+        parser.error('the following arguments are required: toc_file (or --language)')
+
+    toc_file_path = args.toc_file
+    notebooks_dir = args.notebooks[0] if args.notebooks else None
+    output_dir = args.output[0] if args.output else None
+    if args.prune:
+        if args.language:
+            directories = [(nb_dir, output) for _, _, nb_dir, output in args.language]
+        else:
+            directories = [(notebooks_dir or str(Path(toc_file_path).parent), output_dir)]
+        if any(output is None or Path(output).resolve() == Path(nb_dir).resolve() for nb_dir, output in directories):
+            parser.error('--prune requires an output directory other than the notebooks directory')
+    cache_dir = args.cache[0] if args.cache else None
+
+    fragments_dir = args.fragments[0] if args.fragments else None
+    if fragments_dir is None and args.language and cache_dir:
+        fragments_dir = str(Path(cache_dir, 'fragments'))
+    try:
+        options = get_options(
+            assets_dir=args.assets[0] if args.assets else None,
+            assets_url=args.assets_url[0] if args.assets_url else None,
+            fragments_dir=fragments_dir,
+            optimize_images=args.optimize_images,
+            webp=args.webp,
+            split_outputs_size=args.split_outputs[0] if args.split_outputs else None,
+            cache_dir=cache_dir
+        )
+    except ValueError as err:
+        parser.error(str(err))
+
+    if args.trace:
+        start_trace()
+
+    if args.language:
+        convert_batch(
+            [tuple(language) for language in args.language],
+            jobs=args.jobs,
+            cache_dir=cache_dir,
+            options=options,
+            shared_dir=args.shared[0] if args.shared else None,
+            copy_assets=args.copy_assets,
+            prune=args.prune
+        )
+    elif args.watch:
+        TocWatcher(
+            toc_file_path,
+            notebooks_dir=notebooks_dir,
+            output_dir=output_dir,
+            jobs=args.jobs,
+            cache_dir=cache_dir,
+            options=options,
+            shared_dir=args.shared[0] if args.shared else None,
+            copy_assets=args.copy_assets,
+            prune=args.prune
+        ).watch()
+    else:
+        convert_toc(
+            toc_file_path,
+            notebooks_dir=notebooks_dir,
+            output_dir=output_dir,
+            jobs=args.jobs,
+            cache_dir=cache_dir,
+            plan=args.plan,
+            options=options,
+            copy_assets=args.copy_assets,
+            prune=args.prune,
+            shared_dir=args.shared[0] if args.shared else None
+        )
+
+    if args.trace:
+        tracer = stop_trace()
+        tracer.save(args.trace[0])
+        tracer.print_summary()
@@ -0,0 +1,132 @@
+import json
+import os
+import yaml
+
+from pathlib import Path
+
+from .writer import write_text
+
+
+# use the libyaml bindings when available, they are much faster
+YamlLoader = getattr(yaml, 'CBaseLoader', yaml.BaseLoader)
+# libyaml folds escaped scalars differently than the pure Python emitter,
+# keep the latter since each file is only dumped once per build
+YamlDumper = yaml.Dumper
+
+
+def to_yaml_strings(value):
+    """Return the value with all scalars as strings, as `yaml.BaseLoader` loads them
+    """
+    if isinstance(value, dict):
+        return {
+            (k if isinstance(k, str) else json.dumps(k)): to_yaml_strings(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [to_yaml_strings(v) for v in value]
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+class ResourceAccumulator:
+    """Collect contributions to shared files (glossary, notations, index, functions)
+
+    Contributions are kept in memory per file and per source notebook, and
+    each file is written once. Adding a source again replaces its previous
+    contribution. Yaml files start from their base (see `add_base`), so the
+    files of a build only have the contributions of the notebooks it
+    converted. With `update_existing`, yaml files without a base start from
+    their current content instead, to add to them outside of a build, like
+    the per notebook read-modify-write did.
+
+    Yaml files merge the dictionaries of all sources, text files append the
+    text of each source to a header.
+    """
+
+    def __init__(self, update_existing=False):
+        self.files = {}
+        self.conflicts = set()
+        self.update_existing = update_existing
+
+    def _get_file(self, file_path, header=None, base_file_path=None):
+        file_path = str(Path(file_path).resolve())
+        if file_path not in self.files:
+            existing = None
+            existing_file_path = base_file_path
+            if existing_file_path is None and self.update_existing:
+                existing_file_path = file_path
+            # text files start from the header, so converting again into
+            # the same output does not append the functions twice
+            if header is None and existing_file_path and os.path.isfile(existing_file_path):
+                with open(existing_file_path, encoding='utf-8') as existing_file:
+                    existing = yaml.load(existing_file, Loader=YamlLoader)
+            self.files[file_path] = {
+                'is_yaml': header is None,
+                'existing': existing or ({} if header is None else header),
+                'sources': {}
+            }
+        return self.files[file_path]
+
+    def add_base(self, file_path, base_file_path):
+        """Start the yaml file from the content of another file, instead of its own
+
+        The file is written even if no source adds to it.
+        """
+        self._get_file(file_path, base_file_path=base_file_path)
+
+    def add(self, file_path, source, content):
+        """Add the content (a dictionary) of source to the yaml file
+        """
+        self._get_file(file_path)['sources'][str(source)] = to_yaml_strings(content)
+
+    def add_text(self, file_path, source, text, header=''):
+        """Add the text of source to the text file, which starts with `header`
+        """
+        self._get_file(file_path, header)['sources'][str(source)] = text
+
+    def get_content(self, file_path):
+        """Return the merged content of the yaml file, reporting conflicting keys
+        """
+        yaml_file = self._get_file(file_path)
+        content = dict(yaml_file['existing'])
+        key_sources = {}
+
+        for source, source_content in yaml_file['sources'].items():
+            for key, value in source_content.items():
+                if key in key_sources and content[key] != value:
+                    conflict = (file_path, key, source, key_sources[key])
+                    if conflict not in self.conflicts:
+                        self.conflicts.add(conflict)
+                        print(f'{file_path}: "{key}" in {source} overrides {key_sources[key]}')
+                key_sources[key] = source
+                content[key] = value
+
+        return content
+
+    def get_text(self, file_path):
+        """Return the file content, as it will be written
+        """
+        accumulated_file = self._get_file(file_path)
+        if accumulated_file['is_yaml']:
+            return yaml.dump(self.get_content(file_path), Dumper=YamlDumper)
+        return accumulated_file['existing'] + ''.join(accumulated_file['sources'].values())
+
+    def write(self, file_path=None):
+        """Write the file, or all files when no path is given
+
+        Files whose content did not change are left as is.
+        """
+        if file_path is None:
+            file_paths = list(self.files.keys())
+        else:
+            file_paths = [str(Path(file_path).resolve())]
+            file_paths = [path for path in file_paths if path in self.files]
+
+        for path in file_paths:
+            write_text(path, self.get_text(path))
+
+    def discard(self, file_path):
+        """Forget the contributions to the file
+        """
+        self.files.pop(str(Path(file_path).resolve()), None)
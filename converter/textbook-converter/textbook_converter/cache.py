@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import shutil
+
+from pathlib import Path
+
+from . import __version__
+from .writer import copy_file
+
+
+MANIFEST_FILE_NAME = 'manifest.json'
+
+
+def get_converter_version():
+    """Return the converter version, including a digest of its source files
+
+    Any change to the converter code invalidates previously cached sections,
+    even when the package version is not bumped.
+    """
+    digest = hashlib.sha256(__version__.encode('utf-8'))
+    for src_path in sorted(Path(__file__).parent.glob('*.py')):
+        digest.update(src_path.read_bytes())
+    return f'{__version__}+{digest.hexdigest()[:12]}'
+
+
+def get_section_hash(
+    nb_file_path, section_id=None, is_problem_set=False, options=None, version=None
+):
+    """Return the hash for a section, covering everything that affects its conversion
+    """
+    digest = hashlib.sha256()
+    digest.update(Path(nb_file_path).read_bytes())
+    digest.update(json.dumps({
+        'section': section_id,
+        'is_problem_set': is_problem_set,
+        'options': options or {},
+        'version': version or get_converter_version()
+    }, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class BuildCache:
+    """Persistent cache of converted sections, keyed by notebook path
+
+    Each entry stores the section hash in `manifest.json`. The converted
+    markdown and the `textbook` resources (index, functions, glossary and
+    notations) are stored next to it, named after the hash.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_path = Path(cache_dir).resolve()
+        self.sections_path = self.cache_path / 'sections'
+        self.manifest_path = self.cache_path / MANIFEST_FILE_NAME
+        self.version = get_converter_version()
+        self.sections = {}
+
+        if self.manifest_path.is_file():
+            with open(self.manifest_path, encoding='utf-8') as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest.get('version') == self.version:
+                self.sections = manifest.get('sections', {})
+
+    def _key(self, nb_file_path):
+        return str(Path(nb_file_path).resolve())
+
+    def section_hash(self, nb_file_path, section_id=None, is_problem_set=False, options=None):
+        """Return the current hash of the section or None if the notebook is missing
+        """
+        if not Path(nb_file_path).is_file():
+            return None
+        return get_section_hash(
+            nb_file_path, section_id, is_problem_set, options, self.version
+        )
+
+    def is_cached(self, nb_file_path, section_hash, options=None):
+        """Return True if the section was converted before with the same hash
+
+        Asset files written by the section must also still exist.
+        """
+        entry = self.sections.get(self._key(nb_file_path))
+        if (
+            section_hash is None or
+            entry is None or
+            entry['hash'] != section_hash or
+            not (self.sections_path / f'{section_hash}.md').is_file() or
+            not (self.sections_path / f'{section_hash}.json').is_file()
+        ):
+            return False
+
+        assets_dir = (options or {}).get('assets_dir')
+        return not assets_dir or all(
+            os.path.isfile(os.path.join(assets_dir, asset))
+            for asset in entry.get('assets', [])
+        )
+
+    def restore(self, nb_file_path, section_hash, output_dir):
+        """Copy the cached markdown into `output_dir` and return the cached resources
+        """
+        output_path = Path(output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
+        md_file_path = output_path / f'{Path(nb_file_path).stem}.md'
+        copy_file(str(self.sections_path / f'{section_hash}.md'), str(md_file_path))
+
+        with open(self.sections_path / f'{section_hash}.json', encoding='utf-8') as json_file:
+            return json.load(json_file)
+
+    def store(self, nb_file_path, section_hash, output_dir, resources):
+        """Save the converted markdown and resources of the section
+        """
+        md_file_path = Path(output_dir) / f'{Path(nb_file_path).stem}.md'
+        if section_hash is None or not md_file_path.is_file():
+            return
+
+        self.sections_path.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(md_file_path, self.sections_path / f'{section_hash}.md')
+
+        cached_resources = {'textbook': {
+            k: v for k, v in resources.get('textbook', {}).items()
+            if k in ('glossary', 'formulas', 'functions', 'index', 'assets')
+        }}
+        with open(self.sections_path / f'{section_hash}.json', 'w', encoding='utf-8') as json_file:
+            json.dump(cached_resources, json_file)
+
+        self.sections[self._key(nb_file_path)] = {
+            'hash': section_hash,
+            'assets': resources.get('textbook', {}).get('assets', [])
+        }
+
+    def save(self):
+        """Write the manifest and remove cached sections no longer referenced
+        """
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        with open(self.manifest_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump(
+                {'version': self.version, 'sections': self.sections},
+                manifest_file,
+                indent=2,
+                sort_keys=True
+            )
+
+        if self.sections_path.is_dir():
+            hashes = set(entry['hash'] for entry in self.sections.values())
+            for cached_file in self.sections_path.iterdir():
+                if cached_file.stem not in hashes:
+                    os.remove(cached_file)
@@ -1,20 +1,30 @@
-import json
-import nbformat
 import os
 import shutil
 import yaml
 
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from nbconvert.writers import FilesWriter
 
 from . import TextbookExporter, mathigon_ximg_regex, html_img_regex
+from .accumulator import ResourceAccumulator, YamlLoader
+from .cache import BuildCache
+from .filecache import prune_cache_dir
+from .images import format_image_sizes, is_available as is_images_available
+from .manifest import ASSET_DIR_NAMES, write_manifest
+from .reader import read_notebook
+from .toc import Toc
+from .trace import add_events, is_tracing, run_traced, span
+from .writer import copy_file, count_changes, move_file, record_output, record_outputs, write_stream
 
 
 def get_notebook_node(nb_file_path):
     """Return a NotebookNode object from the given notebook file.
+
+    Outputs and data that are not converted are not read, see `read_notebook`.
     """
     try:
-        notebook_node = nbformat.read(nb_file_path, nbformat.NO_CONVERT)
+        with span('read'):
+            notebook_node = read_notebook(nb_file_path)
         return notebook_node
     except Exception as err:
         print(f'Error reading notebook: {err}')
@@ -23,14 +33,24 @@ def get_notebook_node(nb_file_path):
 
 
 def convert_notebook_node(
-    nb_node, file_name, output_dir, section_id='', is_problem_set=False
+    nb_node, file_name, output_dir, section_id='', is_problem_set=False, options=None
 ):
-    """Convert notebook node
+    """Convert notebook node, return the markdown file path and the resources
+
+    The markdown is written to the file cell by cell, as it is generated,
+    and only replaces the file if it changed (`resources['output_changed']`).
+    `options` are passed to the exporter with the `textbook` resources,
+    e.g. `assets_dir` and `assets_url` to write images to asset files, or
+    `optimize_images` to recompress png images (their sizes are printed), or
+    `split_outputs_size` to write large text outputs to asset files (they
+    are listed).
     """
     try:
-        exporter = TextbookExporter()
+        # the notebook is only read, no need for the exporter to copy it
+        exporter = TextbookExporter(read_only=True)
         resources = {
             'textbook': {
+                **(options or {}),
                 'id': file_name,
                 'section': section_id,
                 'is_problem_set': is_problem_set
@@ -40,50 +60,57 @@ def convert_notebook_node(
         if 'textbook' in nb_node['metadata']:
             resources['textbook'] = { **resources['textbook'], **nb_node['metadata']['textbook'] }
 
-        (body, resources) = exporter.from_notebook_node(nb_node, resources=resources)
+        with span('export'):
+            (fragments, resources) = exporter.stream_notebook_node(nb_node, resources=resources)
+            md_file_path = os.path.join(output_dir, file_name + resources['output_extension'])
+            resources['output_changed'] = write_stream(md_file_path, fragments)
 
-        writer = FilesWriter()
-        writer.build_directory = output_dir
-        writer.write(
-            output=body, 
-            resources=resources, 
-            notebook_name=file_name
-        )
+        if 'images' in resources['textbook']:
+            print(f'{file_name}: {format_image_sizes(resources["textbook"]["images"])}')
+        if 'split_outputs' in resources['textbook']:
+            split_outputs = resources['textbook']['split_outputs']
+            print(f'{file_name}: {len(split_outputs)} outputs split out')
+            for output_file_name, lines, size in split_outputs:
+                print(f'  {output_file_name}: {lines} lines, {size / 1024:.0f} KiB')
 
-        return (body, resources)
+        return (md_file_path, resources)
     except Exception as err:
         print(f'Error exporting notebook: {err}')
         return None, None
 
 
-def append_to_glossary_yaml(resources, yaml_output_path):
+def append_to_yaml(content, yaml_file_path, source=None, accumulator=None):
+    """Merge content into the yaml file
+
+    With an accumulator the content is only collected, and written when the
+    accumulator is written. Otherwise the yaml file is updated right away.
+    """
+    if accumulator is None:
+        file_accumulator = ResourceAccumulator(update_existing=True)
+        file_accumulator.add(yaml_file_path, source, content)
+        file_accumulator.write()
+    else:
+        accumulator.add(yaml_file_path, source, content)
+
+
+def append_to_glossary_yaml(resources, yaml_output_path, source=None, accumulator=None):
     """Append 'gloss' metadata into 'glossary.yaml'
     """
     if 'textbook' in resources and 'glossary' in resources['textbook']:
         glossary_file_path = os.path.join(yaml_output_path, 'glossary.yaml')
-
-        new_glossary = resources["textbook"]["glossary"]
-        existing_glossary = yml_to_dict(glossary_file_path) or {}
-        updated_glossary = { **existing_glossary, **new_glossary }
-
-        content = yaml.load(json.dumps(updated_glossary), Loader=yaml.BaseLoader)
-        with open(glossary_file_path, 'w', encoding='utf-8') as glossary_file:
-            glossary_file.write(f'{yaml.dump(content)}')
+        append_to_yaml(
+            resources["textbook"]["glossary"], glossary_file_path, source, accumulator
+        )
 
 
-def append_to_notations_yaml(resources, yaml_output_path):
+def append_to_notations_yaml(resources, yaml_output_path, source=None, accumulator=None):
     """Create and append to 'notations.yaml'
     """
     if 'textbook' in resources and 'formulas' in resources['textbook']:
         formulas_file_path = os.path.join(yaml_output_path, 'notations.yaml')
-
-        new_formulas = resources["textbook"]["formulas"]
-        existing_formulas = yml_to_dict(formulas_file_path) or {}
-        updated_formulas = { **existing_formulas, **new_formulas }
-
-        content = yaml.load(json.dumps(updated_formulas), Loader=yaml.BaseLoader)
-        with open(formulas_file_path, 'w', encoding='utf-8') as formulas_file:
-            formulas_file.write(f'{yaml.dump(content)}')
+        append_to_yaml(
+            resources["textbook"]["formulas"], formulas_file_path, source, accumulator
+        )
 
 
 def append_to_styles(nb_node, output_path):
@@ -97,12 +124,25 @@ def append_to_styles(nb_node, output_path):
             styles_file.write('\n@import "../shared/shared";\n')
 
 
-def append_to_ts(resources, source_path, output_path):
+def append_to_ts(resources, source_path, output_path, source=None, accumulator=None):
     """Create and append to 'functions.ts'
     """
     ts_file_path = os.path.join(output_path, 'functions.ts')
     ts_path = Path(ts_file_path).resolve()
 
+    if accumulator is not None:
+        src_ts_file_path = Path(os.path.join(source_path, 'functions.ts')).resolve()
+        if src_ts_file_path.exists():
+            with open(src_ts_file_path, encoding='utf-8', newline='') as src_ts_file:
+                header = src_ts_file.read()
+        else:
+            header = 'import * as shared from "../shared/shared";\n'
+        functions = ''
+        if 'textbook' in resources and 'functions' in resources['textbook']:
+            functions = f'\n\n{resources["textbook"]["functions"]}'
+        accumulator.add_text(ts_path, source, functions, header)
+        return
+
     if not ts_path.exists():
         src_ts_file_path = Path(os.path.join(source_path, 'functions.ts')).resolve()
         if not src_ts_file_path.exists():
@@ -116,25 +156,20 @@ def append_to_ts(resources, source_path, output_path):
             ts_file.write(f'\n\n{resources["textbook"]["functions"]}')
 
 
-def append_to_index(resources, output_path):
+def append_to_index(resources, output_path, source=None, accumulator=None):
     """Create and append to 'index.yaml'
     """
     if 'textbook' in resources and 'index' in resources['textbook']:
         index_file_path = os.path.join(output_path, 'index.yaml')
-
-        new_index = resources["textbook"]["index"]
-        existing_index = yml_to_dict(index_file_path) or {}
-        updated_index = { **existing_index, **new_index }
-
-        content = yaml.load(json.dumps(updated_index), Loader=yaml.BaseLoader)
-        with open(index_file_path, 'w', encoding='utf-8') as index_file:
-            index_file.write(f'{yaml.dump(content)}')
+        append_to_yaml(
+            resources["textbook"]["index"], index_file_path, source, accumulator
+        )
 
 
-def convert_notebook_file(
-    nb_file_path, output_dir=None, shared_dir=None, section_id=None, is_problem_set=False
+def export_notebook_file(
+    nb_file_path, output_dir=None, section_id=None, is_problem_set=False, options=None
 ):
-    """Convert notebook file to Mathigon markdown format
+    """Convert notebook file to Mathigon markdown and return its resources
     """
     nb_path = Path(nb_file_path).resolve()
 
@@ -146,37 +181,83 @@ def convert_notebook_file(
         print(f'{nb_path} is not a file')
         return None
 
-    nb_node = get_notebook_node(str(nb_path))
+    with span(str(nb_path), 'notebook', size=nb_path.stat().st_size):
+        nb_node = get_notebook_node(str(nb_path))
 
-    if nb_node:
-        file_name = nb_path.stem
-        output_path = output_dir if output_dir else str(nb_path.parent)
-        shared_path = shared_dir if shared_dir else os.path.join(output_path, 'shared')
+        if nb_node:
+            file_name = nb_path.stem
+            output_path = output_dir if output_dir else str(nb_path.parent)
 
-        if not os.path.exists(shared_path):
-            os.makedirs(shared_path, exist_ok=True)
+            print('converting', nb_path)
 
-        print('converting', nb_path)
+            (md_file_path, resources) = convert_notebook_node(
+                nb_node,
+                file_name,
+                output_path,
+                section_id,
+                is_problem_set=is_problem_set,
+                options=options
+            )
 
-        (body, resources) = convert_notebook_node(
-            nb_node,
-            file_name,
-            output_path,
-            section_id,
-            is_problem_set=is_problem_set
-        )
+            if md_file_path:
+                return resources
 
-        if body:
-            append_to_glossary_yaml(resources, shared_path)
-            append_to_notations_yaml(resources, shared_path)
-            append_to_ts(resources, str(nb_path.parent), output_path)
-            append_to_index(resources, output_path)
+    return None
+
+
+def write_notebook_resources(
+    resources, nb_file_path, output_dir=None, shared_dir=None, accumulator=None
+):
+    """Write the converted notebook's glossary, notations, functions and index
+    """
+    nb_path = Path(nb_file_path).resolve()
+    output_path = output_dir if output_dir else str(nb_path.parent)
+    shared_path = shared_dir if shared_dir else os.path.join(output_path, 'shared')
+
+    if not os.path.exists(shared_path):
+        os.makedirs(shared_path, exist_ok=True)
+
+    with span('resources'):
+        append_to_glossary_yaml(resources, shared_path, nb_path, accumulator)
+        append_to_notations_yaml(resources, shared_path, nb_path, accumulator)
+        append_to_ts(resources, str(nb_path.parent), output_path, nb_path, accumulator)
+        append_to_index(resources, output_path, nb_path, accumulator)
+
+
+def convert_notebook_file(
+    nb_file_path,
+    output_dir=None,
+    shared_dir=None,
+    section_id=None,
+    is_problem_set=False,
+    accumulator=None,
+    options=None
+):
+    """Convert notebook file to Mathigon markdown format
+    """
+    resources = export_notebook_file(
+        nb_file_path,
+        output_dir=output_dir,
+        section_id=section_id,
+        is_problem_set=is_problem_set,
+        options=options
+    )
+
+    if resources:
+        write_notebook_resources(
+            resources,
+            nb_file_path,
+            output_dir=output_dir,
+            shared_dir=shared_dir,
+            accumulator=accumulator
+        )
 
 
 def convert_notebook_directory(
     nbs_dir_path,
     output_dir=None,
-    shared_dir=None
+    shared_dir=None,
+    options=None
 ):
     """Convert & combine notebook file in directory to Mathigon format
     """
@@ -191,12 +272,16 @@ def convert_notebook_directory(
         return None
 
     print(f'converting notebooks in {nbs_path}')
+    accumulator = ResourceAccumulator(update_existing=True)
     for nb_file_path in nbs_path.glob('*.ipynb'):
         convert_notebook_file(
             nb_file_path,
             output_dir=output_dir,
-            shared_dir=shared_dir
+            shared_dir=shared_dir,
+            accumulator=accumulator,
+            options=options
         )
+    accumulator.write()
 
 
 def yml_to_dict(yml_file_path):
@@ -209,7 +294,7 @@ def yml_to_dict(yml_file_path):
 
     yml_dict = None
     with open(yml_path, encoding='utf-8') as file:
-        yml_dict = yaml.load(file, Loader=yaml.BaseLoader)
+        yml_dict = yaml.load(file, Loader=YamlLoader)
 
     return yml_dict
 
@@ -232,49 +317,55 @@ def update_image_path(line, source_path):
         return line
 
 
-def get_order_from_toc(toc_file_path, md_dir_path):
+def get_order_from_toc(toc, md_dir_path):
     """Return the chapter title and sections (in order) as defined in toc yaml
+
+    `toc` is a `Toc` or the path to the toc yaml.
     """
-    md_path = md_dir_path.replace(os.path.sep, '/')
-    chapters = yml_to_dict(toc_file_path)
+    chapter = Toc.load(toc).find_chapter(md_dir_path)
+    if chapter is None:
+        return None, []
 
-    chapter = next((ch for ch in chapters if md_path.endswith(ch['url'])), [])
+    return chapter.title, chapter.get_order()
 
-    def get_sections(s):
-        return (s['id'], s['url'][1:] if s['url'].startswith('/') else s['url'])
 
-    return chapter['title'], list(map(get_sections, chapter['sections']))
+def get_standalone_dir(md_dir, section):
+    """Return the directory of a standalone section, next to its chapter directory
+    """
+    return str(Path(md_dir).resolve().parent / section['id'])
 
 
 def standalone(md_dir, section):
     """Turn section into a standalone course
+
+    The section must have been converted into its own directory (see
+    `get_standalone_dir`), where its markdown file is renamed `content.md`.
+    The images and resources of the chapter directory (e.g. copied there
+    with the notebooks) are copied into it, for the section to use.
     """
-    md_dir_path = Path(md_dir).resolve()
+    chapter_path = Path(md_dir).resolve()
+    section_dir_path = Path(get_standalone_dir(md_dir, section))
 
-    if not md_dir_path.exists():
-        print(f'{md_dir_path} not found')
-        return None
+    for dir_name in sorted(ASSET_DIR_NAMES):
+        for src_path in sorted((chapter_path / dir_name).rglob('*')):
+            if src_path.is_file():
+                copy_file(str(src_path), str(section_dir_path / src_path.relative_to(chapter_path)))
 
-    if not md_dir_path.is_dir():
-        print(f'{md_dir_path} is not a directory')
+    # section md file name
+    md_file_path = section_dir_path / (section['url'].split('/')[-1] + '.md')
+
+    if not md_file_path.is_file():
+        print(f'{md_file_path} not found')
         return None
 
-    # section md file name
-    md_file_name = section['url'].split('/')[-1] + '.md'
     # rename md file to required name: `content.md`
-    Path(md_dir_path / Path(md_file_name)).rename(Path(md_dir_path / Path('content.md')))
-    # move section files into own directory
-    _ = os.listdir(md_dir_path)
-    shutil.copytree(md_dir_path, Path(md_dir_path.parent / Path(section['id'])))
-
-    # clean up
-    Path(md_dir_path / Path('content.md')).unlink()
-    Path(md_dir_path / Path('index.yaml')).unlink()
-    Path(md_dir_path / Path('functions.ts')).unlink()
+    move_file(str(md_file_path), str(section_dir_path / 'content.md'))
 
 
-def merge(md_dir, toc_file_path, output_dir=None):
+def merge(md_dir, toc, output_dir=None):
     """Merge markdown files in directory into single file
+
+    `toc` is a `Toc` or the path to the toc yaml.
     """
     md_dir_path = Path(md_dir).resolve()
 
@@ -292,24 +383,26 @@ def merge(md_dir, toc_file_path, output_dir=None):
     merged_md_path = os.path.join(output_path, merged_file_name)
 
     # Assumes section urls in toc corresponds to nb/md file names
-    title, sections = get_order_from_toc(toc_file_path, str(md_dir_path))
+    title, sections = get_order_from_toc(toc, str(md_dir_path))
     if sections:
         md_files_path = [f'{os.path.join(str(md_dir_path), x[1].split("/")[-1])}.md' for x in sections if x[1] != merged_file_name]
     else:
         md_files_path = [x for x in md_dir_path.glob('*.md') if x.name != merged_file_name]
 
-    with open(merged_md_path, 'w', encoding='utf-8') as out_file:
+    def generate_lines():
         if title and sections:
-            out_file.write(f'# {title}\n\n')
+            yield f'# {title}\n\n'
         for count, md_path in enumerate(md_files_path):
             if count > 0:
-                out_file.write('\n\n---\n')
-            out_file.write(f'\n> section: {sections[count][0]}\n\n')
+                yield '\n\n---\n'
+            yield f'\n> section: {sections[count][0]}\n\n'
             with open(md_path, encoding='utf-8') as in_file:
                 for line in in_file:
                     if sections:
                         line = update_image_path(line, sections[count][1].split('/')[0])
-                    out_file.write(line)
+                    yield line
+
+    write_stream(merged_md_path, generate_lines())
 
 
 def convert(
@@ -317,7 +410,8 @@ def convert(
     output_dir='',
     shared_dir='shared',
     section_id=None,
-    is_problem_set=False
+    is_problem_set=False,
+    options=None
 ):
     """Convert notebook file or files in directory to Mathigon markdown
     """
@@ -333,11 +427,468 @@ def convert(
             output_dir=output_dir,
             shared_dir=shared_dir,
             section_id=section_id,
-            is_problem_set=is_problem_set
+            is_problem_set=is_problem_set,
+            options=options
         )
     else:
         convert_notebook_directory(
             nb_file_or_dir_path,
             output_dir=output_dir,
-            shared_dir=shared_dir
+            shared_dir=shared_dir,
+            options=options
+        )
+
+
+# options of the cache directories shared by builds, see `prune_caches`
+CACHE_DIR_OPTIONS = ('fragments_dir', 'image_cache_dir', 'output_cache_dir')
+
+
+def get_options(
+    assets_dir=None,
+    assets_url=None,
+    fragments_dir=None,
+    optimize_images=False,
+    webp=False,
+    split_outputs_size=None,
+    cache_dir=None
+):
+    """Return the exporter options (see `convert_notebook_node`) of the command line options
+
+    Raises a ValueError for options that cannot be used, e.g. `webp` without
+    `assets_dir`.
+    """
+    options = {}
+    if assets_dir:
+        options['assets_dir'] = str(Path(assets_dir).resolve())
+        options['assets_url'] = assets_url or '/assets'
+    if fragments_dir:
+        options['fragments_dir'] = str(Path(fragments_dir).resolve())
+    if cache_dir:
+        options['output_cache_dir'] = str(Path(cache_dir, 'outputs').resolve())
+    if optimize_images or webp:
+        if not is_images_available():
+            raise ValueError('--optimize-images and --webp require Pillow: pip install textbook-converter[images]')
+        if webp and not assets_dir:
+            raise ValueError('--webp requires --assets')
+        options['optimize_images'] = optimize_images
+        options['webp'] = webp
+        if cache_dir:
+            options['image_cache_dir'] = str(Path(cache_dir, 'images').resolve())
+    if split_outputs_size:
+        if not assets_dir:
+            raise ValueError('--split-outputs requires --assets')
+        options['split_outputs_size'] = split_outputs_size
+    return options
+
+
+def convert_toc(
+    toc,
+    notebooks_dir=None,
+    output_dir=None,
+    jobs=1,
+    cache_dir=None,
+    plan=False,
+    options=None,
+    executor=None,
+    on_progress=None,
+    accumulator=None,
+    copy_assets=False,
+    prune=False,
+    shared_dir=None
+):
+    """Convert all sections listed in toc yaml and merge them into courses
+
+    `toc` is a `Toc` or the path to the toc yaml, which is then parsed once.
+
+    With `jobs` > 1 the notebooks are converted in a pool of worker processes.
+    Glossary, notations, functions and index are still written by this process,
+    one section at a time in toc order, so the shared files are deterministic.
+
+    With `cache_dir`, sections whose notebook has not changed since the last
+    build are restored from the cache instead of being converted again. With
+    `plan`, only print which sections would be rebuilt.
+
+    `options` are passed to the exporter, see `convert_notebook_node`.
+
+    A running `executor` can be given instead of `jobs`, it is not shut down.
+    `on_progress` is called with a dictionary after each section and chapter.
+    When tracing (see `trace.start_trace`), the spans recorded by the worker
+    processes are added to the trace.
+    The shared files are collected in `accumulator`, if given, so that they
+    can be updated again later (e.g. in watch mode). The `shared/` directory
+    of the notebooks, or `shared_dir` if there is none, is copied to the
+    output, its glossary and notations get the contributions of the sections.
+    `manifest.json` (see `manifest.build_manifest`) is written in the output.
+    With `copy_assets`, the images and resources the pages reference are
+    copied from the notebooks directory to the output. With `prune`, the
+    files of the output not written by this conversion are deleted (see
+    `remove_stale_outputs`). The cache directories of the options are
+    pruned of their least recently used files (see `prune_caches`).
+    Returns the number of sections converted and restored from the cache.
+    """
+    toc = Toc.load(toc)
+    nb_dir_path = Path(toc.file_path).parent if notebooks_dir is None else Path(notebooks_dir)
+    output_path = output_dir or nb_dir_path
+    if prune and Path(output_path).resolve() == nb_dir_path.resolve():
+        raise ValueError('the notebooks directory cannot be pruned')
+
+    cache = BuildCache(cache_dir) if cache_dir else None
+    own_executor = executor is None and jobs > 1 and not plan
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=jobs)
+    elif plan:
+        executor = None
+
+    chapters = schedule_toc(toc, nb_dir_path, output_path, cache, options, executor, plan)
+    if plan:
+        return {'converted': 0, 'cached': 0, 'failed': 0}
+
+    accumulator = ResourceAccumulator() if accumulator is None else accumulator
+    try:
+        with record_outputs() as outputs:
+            copy_notebooks_shared(nb_dir_path, output_path, accumulator, shared_dir)
+            summary = finish_toc(
+                chapters, toc, output_path, cache, options, accumulator, on_progress
+            )
+            with span('manifest'):
+                manifest = write_manifest(toc, nb_dir_path, output_path)
+            if copy_assets:
+                with span('copy assets'):
+                    copy_referenced_assets(manifest, nb_dir_path, output_path)
+        if prune:
+            with span('prune'):
+                if remove_stale_outputs(output_path, outputs, keep_assets=not copy_assets):
+                    write_manifest(toc, nb_dir_path, output_path)
+        prune_caches(options)
+        return summary
+    finally:
+        if own_executor:
+            executor.shutdown()
+        if cache:
+            cache.save()
+
+
+def schedule_toc(toc, nb_dir_path, output_path, cache=None, options=None, executor=None, plan=False):
+    """List the sections of each chapter of the toc, and submit their conversion to executor
+
+    Cached sections are not submitted. With `plan`, only print which
+    sections would be rebuilt. Returns the chapters for `finish_toc`.
+    """
+    chapters = []
+
+    for chapter in toc.chapters:
+        is_problem_set = chapter.is_problem_set
+        chapter_output = chapter.get_output_dir(output_path)
+        if is_problem_set:
+            os.makedirs(chapter_output, exist_ok=True)
+
+        sections = []
+        for section in chapter.sections:
+            # problem set sections are converted into their own directory
+            section_output = (
+                get_standalone_dir(chapter_output, section) if is_problem_set else chapter_output
+            )
+            section_url = section['url'][1:] if section['url'].startswith('/') else section['url']
+            nb_file_path = os.path.join(nb_dir_path, section_url) + '.ipynb'
+            section_hash = None
+            is_cached = False
+            future = None
+
+            if cache:
+                section_hash = cache.section_hash(
+                    nb_file_path, section['id'], is_problem_set, options
+                )
+                is_cached = cache.is_cached(nb_file_path, section_hash, options)
+
+            if plan:
+                print('cached' if is_cached else 'rebuild', nb_file_path)
+            elif executor and not is_cached:
+                export = (run_traced, export_notebook_file) if is_tracing() else (export_notebook_file,)
+                future = executor.submit(
+                    *export,
+                    nb_file_path,
+                    output_dir=section_output,
+                    section_id=section['id'],
+                    is_problem_set=is_problem_set,
+                    options=options
+                )
+            sections.append(
+                (section, nb_file_path, section_output, section_hash, is_cached, future)
+            )
+
+        chapters.append((chapter_output, is_problem_set, sections))
+
+    return chapters
+
+
+def finish_toc(
+    chapters, toc, output_path, cache=None, options=None, accumulator=None, on_progress=None
+):
+    """Convert or restore the scheduled sections in toc order and merge the chapters
+
+    Sections that were not submitted to an executor are converted in this
+    process. Returns the number of sections converted, restored from the
+    cache and failed, and the number of output files that changed or not.
+    """
+    shared_dir = os.path.join(output_path, 'shared')
+    accumulator = ResourceAccumulator() if accumulator is None else accumulator
+    summary = {'converted': 0, 'cached': 0, 'failed': 0}
+
+    with record_outputs() as outputs:
+        for chapter_output, is_problem_set, sections in chapters:
+            if not len(sections):
+                continue
+
+            for section, nb_file_path, section_output, section_hash, is_cached, future in sections:
+                if is_cached:
+                    with span('cache restore'):
+                        resources = cache.restore(nb_file_path, section_hash, section_output)
+                else:
+                    if future:
+                        resources = future.result()
+                        if is_tracing():
+                            resources, events = resources
+                            add_events(events)
+                        if resources:
+                            # written in the worker process
+                            record_output(
+                                os.path.join(section_output, Path(nb_file_path).stem + '.md'),
+                                resources.pop('output_changed', True)
+                            )
+                    else:
+                        resources = export_notebook_file(
+                            nb_file_path,
+                            output_dir=section_output,
+                            section_id=section['id'],
+                            is_problem_set=is_problem_set,
+                            options=options
+                        )
+                    if cache and resources:
+                        with span('cache store'):
+                            cache.store(nb_file_path, section_hash, section_output, resources)
+
+                if resources:
+                    write_notebook_resources(
+                        resources,
+                        nb_file_path,
+                        output_dir=section_output,
+                        shared_dir=shared_dir,
+                        accumulator=accumulator
+                    )
+                if resources:
+                    summary['cached' if is_cached else 'converted'] += 1
+                else:
+                    summary['failed'] += 1
+                if on_progress:
+                    on_progress({
+                        'event': 'section',
+                        'section': section['id'],
+                        'notebook': str(nb_file_path),
+                        'cached': is_cached,
+                        'converted': bool(resources)
+                    })
+
+                if is_problem_set:
+                    with span('standalone'):
+                        standalone(chapter_output, section)
+
+            if not is_problem_set:
+                with span('merge'):
+                    merge(chapter_output, toc)
+            if on_progress:
+                on_progress({'event': 'chapter', 'output': str(chapter_output)})
+
+        with span('write shared files'):
+            accumulator.write()
+
+    summary['changed'], summary['unchanged'] = count_changes(outputs)
+    print(f'{summary["changed"]} files changed, {summary["unchanged"]} unchanged in {output_path}')
+    return summary
+
+
+def copy_shared(shared_dir, output_shared_dir, accumulator=None):
+    """Copy the files of the shared directory into the output shared directory
+
+    With an accumulator, the glossary and notations are not copied but used
+    as the base of the accumulated files, so that they are only written once.
+    """
+    shared_path = Path(shared_dir).resolve()
+    for src_path in shared_path.rglob('*'):
+        if src_path.is_file() and not src_path.name.startswith('.'):
+            dest_path = Path(output_shared_dir) / src_path.relative_to(shared_path)
+            if accumulator is not None and src_path.name in ('glossary.yaml', 'notations.yaml'):
+                accumulator.add_base(dest_path, src_path)
+            else:
+                copy_file(str(src_path), str(dest_path))
+
+
+def copy_notebooks_shared(notebooks_dir, output_dir, accumulator=None, shared_dir=None):
+    """Copy the `shared/` directory of the notebooks, or `shared_dir` if there is none, to the output
+
+    See `copy_shared`.
+    """
+    nb_shared_dir = os.path.join(notebooks_dir, 'shared')
+    if os.path.isdir(nb_shared_dir):
+        copy_shared(nb_shared_dir, os.path.join(output_dir, 'shared'), accumulator)
+    elif shared_dir and os.path.isdir(shared_dir):
+        copy_shared(shared_dir, os.path.join(output_dir, 'shared'), accumulator)
+
+
+def copy_referenced_assets(manifest, nb_dir_path, output_path, fallback=None):
+    """Copy the images and resources referenced by the pages from the notebooks directory to the output
+
+    `manifest` is the manifest of the build (see `manifest.build_manifest`).
+    Files missing from the notebooks directory are copied from the
+    `fallback` (notebooks directory, output directory), e.g. those of `en`
+    for translations, which use its images. Files not found there either
+    are reported.
+    """
+    for path, src_path in manifest['assets'].items():
+        copy_file(os.path.join(nb_dir_path, src_path), os.path.join(output_path, path))
+    for path in manifest['missing_assets']:
+        if fallback and os.path.isfile(os.path.join(fallback[0], path)):
+            copy_file(os.path.join(fallback[0], path), os.path.join(fallback[1], path))
+        else:
+            print(f'{path} is referenced but not found in {nb_dir_path}')
+
+
+def prune_caches(options):
+    """Delete the least recently used files of the cache directories of the options, when they get too large
+
+    See `filecache.prune_cache_dir`.
+    """
+    for key in CACHE_DIR_OPTIONS:
+        if options and options.get(key) and os.path.isdir(options[key]):
+            with span('prune cache'):
+                prune_cache_dir(options[key])
+
+
+def remove_stale_outputs(output_path, outputs, keep_assets=False):
+    """Delete the files of the output directory that are not outputs of the build, e.g. of removed notebooks
+
+    `outputs` are the resolved paths of the files written by the build
+    (see `writer.record_outputs`). Hidden files, the `shared/` directory
+    (other build steps write to it), and with `keep_assets` the files in
+    `images/` and `resources/` directories are kept. Directories left empty
+    are deleted too. Returns the number of files deleted.
+    """
+    output_path = Path(output_path).resolve()
+    removed = 0
+    for file_path in sorted(output_path.rglob('*')):
+        rel_path = file_path.relative_to(output_path)
+        if (
+            not file_path.is_file()
+            or str(file_path) in outputs
+            or rel_path.parts[0] == 'shared'
+            or any(part.startswith('.') for part in rel_path.parts)
+            or (keep_assets and ASSET_DIR_NAMES.intersection(rel_path.parts[:-1]))
+        ):
+            continue
+        file_path.unlink()
+        removed += 1
+        dir_path = file_path.parent
+        while dir_path != output_path and not any(dir_path.iterdir()):
+            dir_path.rmdir()
+            dir_path = dir_path.parent
+
+    if removed:
+        print(f'{removed} stale files removed from {output_path}')
+    return removed
+
+
+def convert_batch(
+    languages,
+    jobs=1,
+    cache_dir=None,
+    options=None,
+    shared_dir=None,
+    on_progress=None,
+    copy_assets=False,
+    prune=False
+):
+    """Convert the toc of each language, sharing one pool of worker processes
+
+    `languages` is a list of (language, toc, notebooks_dir, output_dir). The
+    notebooks of all languages are submitted to the pool up front, then each
+    language is merged in turn, so no more than `jobs` notebooks are
+    converted at once.
+
+    The `shared/` directory of each language's notebooks is copied to its
+    output, or `shared_dir` for languages without one (by default the
+    `shared/` directory of `en`). With `cache_dir`, each language is cached
+    in its own subdirectory. With `copy_assets`, the images and resources
+    the pages reference are copied too, those missing from a language's
+    notebooks from the notebooks of `en`. With `prune`, the files of each
+    output not written by the conversion of any language are deleted once
+    all languages are converted. The cache directories of the options are
+    pruned at the end (see `prune_caches`).
+
+    Returns the summary of each language, see `convert_toc`. The copied
+    shared files and assets are only counted in the printed total.
+    """
+    if shared_dir is None:
+        shared_dir = next(
+            (os.path.join(nb_dir, 'shared') for lang, _, nb_dir, _ in languages if lang == 'en'),
+            None
         )
+    fallback = next(
+        ((nb_dir, output_dir) for lang, _, nb_dir, output_dir in languages if lang == 'en'),
+        None
+    )
+    if prune and any(
+        Path(output_dir).resolve() == Path(nb_dir).resolve() for _, _, nb_dir, output_dir in languages
+    ):
+        raise ValueError('the notebooks directory cannot be pruned')
+
+    with record_outputs() as outputs:
+        executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+        scheduled = []
+        summaries = {}
+        try:
+            for language, toc, notebooks_dir, output_dir in languages:
+                toc = Toc.load(toc)
+                accumulator = ResourceAccumulator()
+                copy_notebooks_shared(notebooks_dir, output_dir, accumulator, shared_dir)
+
+                cache = BuildCache(os.path.join(cache_dir, language)) if cache_dir else None
+                chapters = schedule_toc(toc, Path(notebooks_dir), output_dir, cache, options, executor)
+                scheduled.append((language, toc, notebooks_dir, output_dir, cache, accumulator, chapters))
+
+            for language, toc, notebooks_dir, output_dir, cache, accumulator, chapters in scheduled:
+                def on_language_progress(progress):
+                    on_progress({'language': language, **progress})
+
+                try:
+                    summaries[language] = finish_toc(
+                        chapters,
+                        toc,
+                        output_dir,
+                        cache,
+                        options,
+                        accumulator,
+                        on_progress=on_language_progress if on_progress else None
+                    )
+                finally:
+                    if cache:
+                        cache.save()
+                with span('manifest'):
+                    manifest = write_manifest(toc, notebooks_dir, output_dir)
+                if copy_assets:
+                    with span('copy assets'):
+                        copy_referenced_assets(manifest, notebooks_dir, output_dir, fallback)
+                print(f'{language}: {summaries[language]}')
+        finally:
+            if executor:
+                executor.shutdown()
+
+        if prune:
+            # once all languages are converted, with the files copied from `en` for the others
+            with span('prune'):
+                for _, toc, notebooks_dir, output_dir, *_ in scheduled:
+                    if remove_stale_outputs(output_dir, outputs, keep_assets=not copy_assets):
+                        write_manifest(toc, notebooks_dir, output_dir)
+        prune_caches(options)
+
+    changed, unchanged = count_changes(outputs)
+    print(f'{changed} files changed, {unchanged} unchanged in total')
+    return summaries
@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import shutil
+
+from pathlib import Path
+
+from .manifest import MANIFEST_FILE_NAME, get_file_entry
+
+
+DEPLOY_FILE_NAME = 'deploy.json'
+
+
+def get_manifest_entries(build_path):
+    """Return the file entries of the converter manifests in the build directory
+
+    Entries are only returned for files whose size and modification time
+    are still those recorded in the manifest, so their hash does not have
+    to be computed again.
+    """
+    entries = {}
+    for manifest_path in build_path.rglob(MANIFEST_FILE_NAME):
+        with open(manifest_path, encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+        files = dict(manifest.get('shared', {}))
+        for item in [*manifest.get('sections', {}).values(), *manifest.get('chapters', {}).values()]:
+            files.update(item.get('files', {}))
+
+        for rel_path, entry in files.items():
+            file_path = manifest_path.parent / rel_path
+            try:
+                stat = file_path.stat()
+            except OSError:
+                continue
+            if stat.st_mtime_ns == entry.get('mtime') and stat.st_size == entry['size']:
+                entries[file_path.relative_to(build_path).as_posix()] = {
+                    'hash': entry['hash'], 'size': entry['size']
+                }
+    return entries
+
+
+def get_build_files(build_dir):
+    """Return the hash and size of each file in the build directory, by relative path
+
+    Hashes recorded in the converter manifests are reused when possible.
+    Hidden files and directories are left out.
+    """
+    build_path = Path(build_dir).resolve()
+    entries = get_manifest_entries(build_path)
+    files = {}
+    for dir_path, dir_names, file_names in os.walk(build_path):
+        dir_names[:] = sorted(d for d in dir_names if not d.startswith('.'))
+        for file_name in sorted(file_names):
+            if file_name.startswith('.'):
+                continue
+            file_path = Path(dir_path) / file_name
+            rel_path = file_path.relative_to(build_path).as_posix()
+            files[rel_path] = entries.get(rel_path) or get_file_entry(file_path)
+    return files
+
+
+def load_previous_files(previous):
+    """Return the files of a previous build directory, or of the `deploy.json` of a previous package
+    """
+    if os.path.isdir(previous):
+        return get_build_files(previous)
+    with open(previous, encoding='utf-8') as previous_file:
+        return json.load(previous_file)['files']
+
+
+def compare_files(files, previous_files):
+    """Return the paths that were added, changed and deleted since the previous files
+    """
+    added = sorted(path for path in files if path not in previous_files)
+    changed = sorted(
+        path for path, entry in files.items()
+        if path in previous_files and previous_files[path]['hash'] != entry['hash']
+    )
+    deleted = sorted(path for path in previous_files if path not in files)
+    return added, changed, deleted
+
+
+def package(build_dir, package_dir, previous=None):
+    """Copy the files of the build that changed since the previous build into the package directory
+
+    The files are copied under `files/`, with their path in the build.
+    `deploy.json` lists the added, changed and deleted paths, and the hash
+    and size of all files of the build, to compare the next build with.
+    `deleted.txt` lists the deleted paths, one per line. Without `previous`,
+    all files are added.
+    """
+    build_path = Path(build_dir).resolve()
+    package_path = Path(package_dir).resolve()
+    if package_path.exists() and any(package_path.iterdir()):
+        raise ValueError(f'{package_path} is not empty')
+
+    files = get_build_files(build_path)
+    previous_files = load_previous_files(previous) if previous else {}
+    added, changed, deleted = compare_files(files, previous_files)
+
+    files_path = package_path / 'files'
+    for rel_path in [*added, *changed]:
+        dest_path = files_path / rel_path
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(build_path / rel_path, dest_path)
+
+    package_path.mkdir(parents=True, exist_ok=True)
+    deploy = {'added': added, 'changed': changed, 'deleted': deleted, 'files': files}
+    with open(package_path / DEPLOY_FILE_NAME, 'w', encoding='utf-8') as deploy_file:
+        json.dump(deploy, deploy_file, indent=2, sort_keys=True)
+        deploy_file.write('\n')
+    with open(package_path / 'deleted.txt', 'w', encoding='utf-8') as deleted_file:
+        deleted_file.writelines(f'{path}\n' for path in deleted)
+
+    unchanged = len(files) - len(added) - len(changed)
+    print(
+        f'{len(added)} added, {len(changed)} changed, {len(deleted)} deleted, '
+        f'{unchanged} unchanged in {package_path}'
+    )
+    return deploy
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='textbook_converter.deploy',
+        description='Package the files of a build that changed since a previous build'
+    )
+    parser.add_argument('build_dir', type=str, help='directory of the current build')
+    parser.add_argument('-o', '--output', nargs=1, type=str, required=True, help='empty directory to write the package to')
+    parser.add_argument('-p', '--previous', nargs=1, type=str, help='directory of the previous build, or deploy.json of the previous package (default: package all files)')
+
+    args = parser.parse_args()
+    try:
+        package(args.build_dir, args.output[0], args.previous[0] if args.previous else None)
+    except ValueError as err:
+        parser.error(str(err))
@@ -0,0 +1,89 @@
+import os
+
+
+# size of each cache directory, beyond which the least recently used files are deleted
+MAX_CACHE_SIZE = 512 * 1024 * 1024
+
+
+class FileCache:
+    """Files on disk, keyed by the hash of what they are made from
+
+    The files are shared by processes, languages and builds. Without a
+    cache directory, nothing is cached. Files are marked as used when read,
+    so that the directory can be pruned of the least recently used (see
+    `prune_cache_dir`).
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+
+    def get_path(self, key, suffix):
+        return os.path.join(self.cache_dir, key[:2], f'{key}{suffix}')
+
+    def get(self, key, suffix):
+        if not self.cache_dir:
+            return None
+        file_path = self.get_path(key, suffix)
+        try:
+            with open(file_path, 'rb') as cached_file:
+                data = cached_file.read()
+        except OSError:
+            return None
+        touch(file_path)
+        return data
+
+    def put(self, key, suffix, data):
+        if not self.cache_dir:
+            return
+        file_path = self.get_path(key, suffix)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f'{file_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as cached_file:
+            cached_file.write(data)
+        os.replace(tmp_path, file_path)
+
+
+def touch(file_path):
+    """Mark the cached file as used, see `prune_cache_dir`
+    """
+    try:
+        os.utime(file_path)
+    except OSError:
+        pass
+
+
+def prune_cache_dir(cache_dir, max_size=MAX_CACHE_SIZE):
+    """Delete the least recently used files of the cache directory, if it is larger than max_size
+
+    Cached files are marked as used when they are read (see `touch`) or
+    written. Files are deleted until the directory is down to three quarters
+    of `max_size`, so that it is not pruned again after every build. Returns
+    the number of files deleted.
+    """
+    files = []
+    for dir_path, _, file_names in os.walk(cache_dir):
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, file_path))
+
+    size = sum(file_size for _, file_size, _ in files)
+    if size <= max_size:
+        return 0
+
+    removed = 0
+    for _, file_size, file_path in sorted(files):
+        if size <= max_size * 3 // 4:
+            break
+        try:
+            os.remove(file_path)
+        except OSError:
+            continue
+        size -= file_size
+        removed += 1
+
+    print(f'{removed} least recently used files removed from {cache_dir}')
+    return removed
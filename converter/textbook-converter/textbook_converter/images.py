@@ -0,0 +1,131 @@
+import hashlib
+import io
+
+from .filecache import FileCache
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# widths of the smaller webp variants, for images wider than them
+WEBP_WIDTHS = (480, 960)
+
+
+def is_available():
+    """Return True if Pillow is installed, see the `images` extra of the package
+    """
+    return Image is not None
+
+
+def to_exact_palette(image):
+    """Return the image with a palette if it has 256 colors or less, without changing any pixel
+
+    Images with a transparent color (tRNS) are returned as is, a palette
+    would lose it.
+    """
+    if 'transparency' in image.info:
+        return image
+    if image.mode == 'RGBA' and image.getextrema()[3][0] == 255:
+        image = image.convert('RGB')
+    if image.mode != 'RGB':
+        return image
+    colors = image.getcolors(256)
+    if not colors:
+        return image
+    palette = Image.new('P', (1, 1))
+    values = [value for _, color in colors for value in color]
+    palette.putpalette(values + [0] * (768 - len(values)))
+    return image.quantize(palette=palette, dither=Image.Dither.NONE)
+
+
+def optimize_png(data, cache_dir=None):
+    """Return the png losslessly recompressed, or as is if that is not smaller
+
+    Opaque images lose their alpha channel, and images with few colors get
+    a palette. Metadata chunks are dropped. Images Pillow cannot read or
+    write are returned as is.
+    """
+    if Image is None:
+        return data
+    cache = FileCache(cache_dir)
+    key = hashlib.sha256(data).hexdigest()
+    optimized = cache.get(key, '.png')
+    if optimized is None:
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image.load()
+                output = io.BytesIO()
+                to_exact_palette(image).save(output, 'PNG', optimize=True)
+            optimized = output.getvalue()
+        except Exception as err:  # Pillow raises various errors for unusual images
+            print(f'Could not optimize image: {err}')
+            optimized = data
+        if len(optimized) >= len(data):
+            optimized = data
+        cache.put(key, '.png', optimized)
+    return optimized
+
+
+def get_webp_variants(data, cache_dir=None):
+    """Return the width and lossless webp data of the image, and of its smaller variants
+
+    The variants are resized to `WEBP_WIDTHS` narrower than the image.
+    The first item is the image at its own width.
+    """
+    if Image is None:
+        return []
+    try:
+        return get_cached_webp_variants(data, cache_dir)
+    except Exception as err:  # Pillow raises various errors for unusual images
+        print(f'Could not convert image to webp: {err}')
+        return []
+
+
+def get_cached_webp_variants(data, cache_dir=None):
+    """Return the webp variants of `get_webp_variants`, raise Pillow errors
+    """
+    cache = FileCache(cache_dir)
+    key = hashlib.sha256(data).hexdigest()
+    with Image.open(io.BytesIO(data)) as image:
+        if 'transparency' in image.info:
+            # webp has no transparent color, only an alpha channel
+            image = image.convert('RGBA')
+        width, height = image.size
+        variants = []
+        for variant_width in [width, *sorted(w for w in WEBP_WIDTHS if w < width)]:
+            suffix = f'-{variant_width}.webp'
+            webp = cache.get(key, suffix)
+            if webp is None:
+                variant = image
+                if variant_width != width:
+                    variant_height = max(1, round(height * variant_width / width))
+                    variant = image.resize((variant_width, variant_height), Image.LANCZOS)
+                output = io.BytesIO()
+                variant.save(output, 'WEBP', lossless=True)
+                webp = output.getvalue()
+                cache.put(key, suffix, webp)
+            variants.append((variant_width, webp))
+    return variants
+
+
+def add_image_sizes(textbook, original_size, size):
+    """Count the image and its size before and after optimization in the textbook resources
+    """
+    add_images(textbook, (1, original_size, size))
+
+
+def add_images(textbook, images):
+    """Add the images counted in other resources (e.g. of a cell) to the textbook resources
+    """
+    count, total_original_size, total_size = textbook.get('images', (0, 0, 0))
+    textbook['images'] = (count + images[0], total_original_size + images[1], total_size + images[2])
+
+
+def format_image_sizes(images):
+    """Return a summary of the sizes counted with `add_image_sizes`
+    """
+    count, original_size, size = images
+    saved = 100 * (original_size - size) / original_size if original_size else 0
+    return f'{count} images, {original_size / 1024:.0f} KiB -> {size / 1024:.0f} KiB ({saved:.0f}% smaller)'
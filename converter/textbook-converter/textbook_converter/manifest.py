@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import posixpath
+import re
+
+from pathlib import Path
+from urllib.parse import unquote
+
+from .toc import strip_url
+from .writer import write_text
+
+
+MANIFEST_FILE_NAME = 'manifest.json'
+ASSET_DIR_NAMES = {'images', 'resources'}
+
+reference_regex = re.compile(
+    r'(?:src|href)=(?:"([^"]+)"|\'([^\']+)\')|\]\(([^)\s]+)|^> hero: *(\S+)'
+)
+url_scheme_regex = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*:')
+
+
+def get_file_entry(file_path):
+    """Return the hash (sha256) and size of the file
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return {'hash': digest.hexdigest(), 'size': os.path.getsize(file_path)}
+
+
+def get_files(file_paths, output_path):
+    """Return the entry of each existing file, by path relative to output path
+
+    Entries also have the modification time of the file (in ns) when it was
+    hashed, to tell whether the file changed since.
+    """
+    files = {}
+    for file_path in sorted(file_paths):
+        if os.path.isfile(file_path):
+            # before hashing, a file modified meanwhile gets an outdated time
+            mtime = os.stat(file_path).st_mtime_ns
+            files[Path(file_path).relative_to(output_path).as_posix()] = {
+                **get_file_entry(file_path), 'mtime': mtime
+            }
+    return files
+
+
+def get_references(md_file_path):
+    """Return the local files (images, resources, assets) the markdown file links to
+
+    Images (markdown, `<img>`, `x-img` and hero images) and links are
+    included, as written, without query or fragment. Links to pages
+    (notebooks, except in `resources/`) and to other sites are left out.
+    """
+    references = set()
+    if not os.path.isfile(md_file_path):
+        return []
+    with open(md_file_path, encoding='utf-8') as md_file:
+        for line in md_file:
+            for match in reference_regex.finditer(line):
+                url = re.split(r'[?#]', next(g for g in match.groups() if g))[0]
+                if not url or url.startswith('//') or url_scheme_regex.match(url):
+                    continue
+                parts = url.rstrip('/').split('/')
+                is_page = parts[-1].endswith(('.md', '.ipynb', '.html')) and 'resources' not in parts
+                if '.' in parts[-1] and not is_page:
+                    references.add(url)
+    return sorted(references)
+
+
+def resolve_reference(url, base_dir):
+    """Return the path of the referenced file relative to the content directory
+
+    The content directory (notebooks or output) is served under
+    `/content`, and relative urls are relative to `base_dir`. Returns None
+    for files outside of it (e.g. `/assets`).
+    """
+    url = unquote(url)
+    if url.startswith('/content/'):
+        path = url[len('/content/'):]
+    elif url.startswith('/'):
+        return None
+    else:
+        path = posixpath.join(base_dir, url)
+    path = posixpath.normpath(path)
+    return None if path.startswith('..') else path
+
+
+def get_pages(toc, output_path):
+    """Return the markdown file of each page, with its directory and the directory of its notebooks
+
+    Pages are the merged chapters, in the directory of their notebooks,
+    and the standalone (problem set) sections, in a directory of their
+    own. Directories are relative to the output and notebooks directory.
+    """
+    for chapter in toc.chapters:
+        if chapter.is_problem_set:
+            for section in chapter.sections:
+                md_file_path = Path(output_path, section['id'], 'content.md')
+                yield md_file_path, section['id'], posixpath.dirname(strip_url(section['url']))
+        else:
+            yield Path(output_path, chapter.url, 'content.md'), chapter.url, chapter.url
+
+
+def get_assets(toc, nb_dir_path, output_path):
+    """Return the images and resources referenced by the pages, and the missing ones
+
+    Only files in `images/` and `resources/` directories are assets. The
+    assets map their path in the output directory to their path in the
+    notebooks directory, which differ for relative urls in standalone
+    sections. Missing assets are the paths not found in the notebooks
+    directory.
+    """
+    assets = {}
+    missing = set()
+    for md_file_path, page_dir, nb_dir in get_pages(toc, output_path):
+        for url in get_references(md_file_path):
+            path = resolve_reference(url, page_dir)
+            if path is None or not ASSET_DIR_NAMES.intersection(path.split('/')[:-1]):
+                continue
+            src_path = resolve_reference(url, nb_dir)
+            if os.path.isfile(os.path.join(nb_dir_path, src_path)):
+                assets[path] = src_path
+            else:
+                missing.add(src_path)
+    return dict(sorted(assets.items())), sorted(missing)
+
+
+def build_manifest(toc, nb_dir_path, output_path):
+    """Return the manifest of the converted toc
+
+    Each section (by url) has its id, uuid, the hash of its notebook, the
+    files generated for it, with their hash and size, and the files it
+    references. Chapters have the files merged from their sections, and
+    `shared` the files of the shared directory. `assets` maps the images
+    and resources the pages reference to their notebooks directory path
+    (see `get_assets`), and `missing_assets` lists those not found there.
+    """
+    output_path = Path(output_path).resolve()
+    manifest = {'sections': {}, 'chapters': {}, 'shared': {}}
+
+    for chapter in toc.chapters:
+        chapter_output = Path(chapter.get_output_dir(output_path))
+        section_files = set()
+
+        for section in chapter.sections:
+            section_url = strip_url(section['url'])
+            nb_file_path = os.path.join(nb_dir_path, section_url) + '.ipynb'
+            if chapter.is_problem_set:
+                section_output = chapter_output.parent / section['id']
+                md_file_path = section_output / 'content.md'
+                file_paths = [p for p in section_output.glob('*') if p.is_file()]
+            else:
+                md_file_path = chapter_output / (Path(section_url).name + '.md')
+                file_paths = [md_file_path]
+            section_files.update(str(p) for p in file_paths)
+
+            manifest['sections'][section_url] = {
+                'id': section['id'],
+                'uuid': section.get('uuid'),
+                'chapter': chapter.url,
+                'notebook': section_url + '.ipynb',
+                'notebook_hash': (
+                    get_file_entry(nb_file_path)['hash'] if os.path.isfile(nb_file_path) else None
+                ),
+                'files': get_files(file_paths, output_path),
+                'references': get_references(md_file_path)
+            }
+
+        if not chapter.is_problem_set:
+            manifest['chapters'][chapter.url] = {
+                'sections': [strip_url(section['url']) for section in chapter.sections],
+                'files': get_files(
+                    [str(p) for p in chapter_output.glob('*') if str(p) not in section_files],
+                    output_path
+                )
+            }
+
+    shared_path = output_path / 'shared'
+    manifest['shared'] = get_files(
+        [str(p) for p in shared_path.rglob('*') if not p.name.startswith('.')], output_path
+    )
+    manifest['assets'], manifest['missing_assets'] = get_assets(toc, nb_dir_path, output_path)
+    return manifest
+
+
+def write_manifest(toc, nb_dir_path, output_path):
+    """Write `manifest.json` in output path, see `build_manifest`
+    """
+    manifest = build_manifest(toc, nb_dir_path, output_path)
+    write_text(
+        os.path.join(output_path, MANIFEST_FILE_NAME),
+        json.dumps(manifest, indent=2, sort_keys=True) + '\n'
+    )
+    return manifest
@@ -0,0 +1,105 @@
+import json
+
+import nbformat
+
+from nbformat.notebooknode import from_dict
+from nbformat.v4.rwbase import strip_transient
+
+
+def join_lines(value):
+    return ''.join(value) if isinstance(value, list) else value
+
+
+def get_output_mime_types(data):
+    """Return the mime types of an output that `handle_code_cell` uses
+
+    Only the first image, or else html, latex or plain text, is converted.
+    Latex is also kept because its presence changes how output is indented.
+    """
+    mime_types = []
+    for mime_type in data:
+        if 'image/' in mime_type:
+            mime_types.append(mime_type)
+            break
+    else:
+        for mime_type in ('text/html', 'text/latex', 'text/plain'):
+            if mime_type in data:
+                mime_types.append(mime_type)
+                break
+    if 'text/latex' in data and 'text/latex' not in mime_types:
+        mime_types.append('text/latex')
+    return mime_types
+
+
+def prune_output(output):
+    """Keep only the output data the converter uses, with its lines joined
+    """
+    if 'metadata' in output:
+        output['metadata'] = {}
+    if 'data' in output:
+        output['data'] = {
+            mime_type: join_lines(output['data'][mime_type])
+            for mime_type in get_output_mime_types(output['data'])
+        }
+    if 'text' in output:
+        output['text'] = join_lines(output['text'])
+    return output
+
+
+def is_output_skipped(cell):
+    """Return True if the outputs of the code cell are never converted
+    """
+    metadata = cell.get('metadata', {})
+    return (
+        metadata.get('include_output', True) is False or
+        'sanity-check' in metadata.get('tags', []) or
+        not cell['source'].strip()
+    )
+
+
+def prune_cell(cell):
+    cell['source'] = join_lines(cell.get('source', ''))
+    if cell['cell_type'] == 'code' and is_output_skipped(cell):
+        cell['outputs'] = []
+    for attachment in cell.get('attachments', {}).values():
+        for mime_type, data in attachment.items():
+            attachment[mime_type] = join_lines(data)
+    return cell
+
+
+def prune_object(obj):
+    """Prune notebook objects as they are parsed, inner objects first
+
+    Output data is dropped as soon as its output is parsed, and outputs as
+    soon as their cell is, so unused payloads are not kept until the whole
+    notebook is parsed.
+    """
+    if 'output_type' in obj:
+        return prune_output(obj)
+    if 'cell_type' in obj:
+        return prune_cell(obj)
+    return obj
+
+
+def read_notebook(nb_file_path):
+    """Return the notebook, without the outputs and data the converter does not use
+
+    Unlike `nbformat.read`, the notebook is not validated, and widget state
+    and unused outputs (cells without output, sanity checks, mime types not
+    converted) are discarded while parsing. Notebooks in a format other
+    than v4 are read with `nbformat.read`.
+    """
+    with open(nb_file_path, encoding='utf-8') as nb_file:
+        nb_dict = json.load(nb_file, object_hook=prune_object)
+
+    if nb_dict.get('nbformat') != 4:
+        return nbformat.read(nb_file_path, nbformat.NO_CONVERT)
+
+    metadata = nb_dict.setdefault('metadata', {})
+    metadata.pop('widgets', None)
+    if metadata.get('textbook', {}).get('include_output') is False:
+        for cell in nb_dict.get('cells', []):
+            if 'include_output' not in cell.get('metadata', {}):
+                cell['outputs'] = []
+
+    return strip_transient(from_dict(nb_dict))
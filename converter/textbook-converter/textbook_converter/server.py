@@ -0,0 +1,188 @@
+import json
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .converter import get_options
+from .watcher import TocWatcher
+
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+CONVERT_PARAMS = {'toc', 'notebooks', 'output', 'language', 'cache', 'shared'}
+# params of the conversion options, named after the command line options
+OPTION_PARAMS = {
+    'assets', 'assets_url', 'copy_assets', 'prune', 'optimize_images', 'webp',
+    'split_outputs', 'fragments'
+}
+
+
+class ConverterServer:
+    """Serve conversion requests, one JSON-RPC message per line
+
+    Requests are read from `input` and responses written to `output`:
+
+        {"jsonrpc": "2.0", "id": 1, "method": "convert", "params": {
+            "toc": "notebooks/toc.yaml", "notebooks": "notebooks",
+            "output": "working/content", "language": "en"}}
+
+    `params` can also include the command line options of a conversion
+    (see `OPTION_PARAMS`). While converting, `progress` notifications are
+    written for each section and chapter, followed by the response with the
+    number of converted, cached and failed sections.
+
+    The `update` method, with the `output` of a previous `convert` request,
+    converts the sections whose notebook changed since the last request of
+    that output, like watch mode (see `TocWatcher`). The `shutdown` method
+    (or the end of the input) stops the server.
+    """
+
+    def __init__(self, input, output, jobs=1):
+        self.input = input
+        self.output = output
+        self.jobs = jobs
+        self.executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+        self.watchers = {}
+
+    def send(self, message):
+        self.output.write(json.dumps({'jsonrpc': '2.0', **message}) + '\n')
+        self.output.flush()
+
+    def send_error(self, id, code, message):
+        self.send({'id': id, 'error': {'code': code, 'message': message}})
+
+    def get_progress_handler(self, id, language):
+        def on_progress(progress):
+            self.send({
+                'method': 'progress',
+                'params': {'id': id, 'language': language, **progress}
+            })
+        return on_progress
+
+    def send_result(self, id, language, start, summary):
+        self.send({
+            'id': id,
+            'result': {
+                'language': language,
+                'seconds': round(time.perf_counter() - start, 3),
+                **summary
+            }
+        })
+
+    def convert(self, id, params):
+        if not isinstance(params, dict) or 'toc' not in params:
+            self.send_error(id, INVALID_PARAMS, '"toc" is required')
+            return
+
+        unknown_params = set(params) - CONVERT_PARAMS - OPTION_PARAMS
+        if unknown_params:
+            self.send_error(id, INVALID_PARAMS, f'unknown params: {", ".join(sorted(unknown_params))}')
+            return
+
+        try:
+            options = get_options(
+                assets_dir=params.get('assets'),
+                assets_url=params.get('assets_url'),
+                fragments_dir=params.get('fragments'),
+                optimize_images=bool(params.get('optimize_images')),
+                webp=bool(params.get('webp')),
+                split_outputs_size=params.get('split_outputs'),
+                cache_dir=params.get('cache')
+            )
+        except ValueError as err:
+            self.send_error(id, INVALID_PARAMS, str(err))
+            return
+
+        language = params.get('language', 'en')
+        watcher = TocWatcher(
+            params['toc'],
+            notebooks_dir=params.get('notebooks'),
+            output_dir=params.get('output'),
+            jobs=self.jobs,
+            cache_dir=params.get('cache'),
+            options=options,
+            shared_dir=params.get('shared'),
+            executor=self.executor,
+            copy_assets=bool(params.get('copy_assets')),
+            prune=bool(params.get('prune')),
+            on_progress=self.get_progress_handler(id, language)
+        )
+        start = time.perf_counter()
+        summary = watcher.build()
+        self.watchers[str(Path(watcher.output_path).resolve())] = watcher
+        self.send_result(id, language, start, summary)
+
+    def update(self, id, params):
+        if not isinstance(params, dict) or 'output' not in params:
+            self.send_error(id, INVALID_PARAMS, '"output" is required')
+            return
+
+        watcher = self.watchers.get(str(Path(params['output']).resolve()))
+        if watcher is None:
+            self.send_error(id, INVALID_PARAMS, f'"{params["output"]}" was not converted')
+            return
+
+        language = params.get('language', 'en')
+        watcher.on_progress = self.get_progress_handler(id, language)
+        start = time.perf_counter()
+        summary = watcher.poll()
+        self.send_result(id, language, start, summary)
+
+    def handle(self, line):
+        """Handle one request, return False when the server should stop
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as err:
+            self.send_error(None, PARSE_ERROR, str(err))
+            return True
+
+        if not isinstance(request, dict) or 'method' not in request:
+            self.send_error(None, INVALID_REQUEST, 'invalid request')
+            return True
+
+        id = request.get('id')
+        method = request['method']
+
+        if method == 'shutdown':
+            self.send({'id': id, 'result': None})
+            return False
+        if method not in ('convert', 'update'):
+            self.send_error(id, METHOD_NOT_FOUND, f'unknown method "{method}"')
+            return True
+
+        try:
+            getattr(self, method)(id, request.get('params'))
+        except Exception as err:
+            self.send_error(id, SERVER_ERROR, f'{type(err).__name__}: {err}')
+        return True
+
+    def serve(self):
+        try:
+            for line in self.input:
+                if line.strip() and not self.handle(line):
+                    break
+        finally:
+            if self.executor:
+                self.executor.shutdown()
+
+
+def serve(jobs=1):
+    """Serve conversion requests from stdin until the end of the input
+
+    Responses are the only output on stdout: anything else printed while
+    converting, including by worker processes, goes to stderr.
+    """
+    sys.stdout.flush()
+    output = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    ConverterServer(sys.stdin, output, jobs=jobs).serve()
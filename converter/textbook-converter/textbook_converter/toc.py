@@ -0,0 +1,103 @@
+import os
+import yaml
+
+from collections import Counter
+from pathlib import Path
+
+from .accumulator import YamlLoader
+
+
+def strip_url(url):
+    return url[1:] if url.startswith('/') else url
+
+
+class TocChapter:
+    """A chapter of the toc, with its sections (dictionaries as in the toc yaml)
+    """
+
+    def __init__(self, chapter):
+        self.title = chapter.get('title')
+        self.url = strip_url(chapter['url'])
+        self.is_problem_set = chapter['url'].startswith('/problem-sets')
+        self.sections = chapter.get('sections') or []
+        self.sections_by_id = {section['id']: section for section in self.sections}
+
+    def get_output_dir(self, output_path):
+        return os.path.join(output_path, self.url)
+
+    def get_order(self):
+        """Return the id and url (without leading `/`) of each section, in order
+        """
+        return [(section['id'], strip_url(section['url'])) for section in self.sections]
+
+
+class Toc:
+    """Chapters and sections of a toc yaml, indexed by url and id
+
+    Load once with `Toc.load` and pass it to `convert_toc`, `merge`, etc.,
+    instead of the toc yaml path, to parse the yaml only once.
+    """
+
+    def __init__(self, chapters, file_path=None):
+        self.file_path = file_path
+        self.chapters = [TocChapter(chapter) for chapter in chapters or []]
+        self.chapters_by_url = {chapter.url: chapter for chapter in self.chapters}
+        self.sections_by_url = {
+            strip_url(section['url']): (chapter, section)
+            for chapter in self.chapters for section in chapter.sections
+        }
+        self.validate()
+
+    @classmethod
+    def load(cls, toc):
+        """Return the toc of the toc yaml file, or toc itself if it is already a Toc
+        """
+        if isinstance(toc, cls):
+            return toc
+        toc_path = Path(toc).resolve()
+        with open(toc_path, encoding='utf-8') as toc_file:
+            return cls(yaml.load(toc_file, Loader=YamlLoader), str(toc_path))
+
+    def validate(self):
+        """Raise ValueError for ids that would overwrite each other's output
+
+        Chapter urls and section ids within a chapter must be unique, and so
+        must problem set section ids, which become top level directories.
+        Duplicate uuids are only reported.
+        """
+        errors = []
+        for url, count in Counter(chapter.url for chapter in self.chapters).items():
+            if count > 1:
+                errors.append(f'chapter url "/{url}" is used {count} times')
+
+        top_level_dirs = set(url.split('/')[0] for url in self.chapters_by_url)
+        for chapter in self.chapters:
+            for id, count in Counter(section['id'] for section in chapter.sections).items():
+                if count > 1:
+                    errors.append(f'section id "{id}" is used {count} times in "/{chapter.url}"')
+            if chapter.is_problem_set:
+                for section in chapter.sections:
+                    if section['id'] in top_level_dirs:
+                        errors.append(f'problem set id "{section["id"]}" is also a chapter url')
+                    top_level_dirs.add(section['id'])
+
+        if errors:
+            raise ValueError(f'{self.file_path or "toc"}: ' + ', '.join(errors))
+
+        uuids = Counter(
+            section['uuid'] for chapter in self.chapters
+            for section in chapter.sections if 'uuid' in section
+        )
+        for uuid, count in uuids.items():
+            if count > 1:
+                print(f'{self.file_path or "toc"}: uuid {uuid} is used by {count} sections')
+
+    def find_chapter(self, md_dir_path):
+        """Return the chapter converted into the directory, matching the end of its path
+        """
+        parts = Path(md_dir_path).parts
+        for start in range(len(parts)):
+            chapter = self.chapters_by_url.get('/'.join(parts[start:]))
+            if chapter is not None:
+                return chapter
+        return None
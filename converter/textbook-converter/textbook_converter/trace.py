@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+from contextlib import contextmanager
+
+
+# the tracer of this process, while tracing
+_tracer = None
+
+
+class Tracer:
+    """Record the wall time, CPU time and memory peak of conversion phases
+
+    Phases are recorded as complete events of the Chrome trace event format,
+    which can be opened in chrome://tracing or https://ui.perfetto.dev.
+    Memory peaks are traced with `tracemalloc`, which slows the conversion.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.stack = []
+
+    @contextmanager
+    def span(self, name, category='phase', **args):
+        current, peak = tracemalloc.get_traced_memory()
+        if self.stack:
+            self.stack[-1]['peak'] = max(self.stack[-1]['peak'], peak)
+        reset_peak()
+        frame = {'peak': current}
+        self.stack.append(frame)
+        start = time.perf_counter_ns()
+        start_cpu = time.process_time_ns()
+        try:
+            yield args
+        finally:
+            duration = time.perf_counter_ns() - start
+            cpu = time.process_time_ns() - start_cpu
+            _, peak = tracemalloc.get_traced_memory()
+            peak = max(frame['peak'], peak)
+            reset_peak()
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1]['peak'] = max(self.stack[-1]['peak'], peak)
+
+            self.events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': start / 1000,
+                'dur': duration / 1000,
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': {
+                    **args,
+                    'cpu_ms': round(cpu / 1e6, 3),
+                    'memory_peak_kb': round((peak - current) / 1024, 1)
+                }
+            })
+
+    def save(self, trace_file_path):
+        """Write the events as Chrome trace event JSON
+        """
+        with open(trace_file_path, 'w', encoding='utf-8') as trace_file:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, trace_file)
+
+    def print_summary(self, count=10):
+        """Print the total of each phase, and the slowest and largest notebooks
+        """
+        phases = {}
+        for event in self.events:
+            if event['cat'] == 'phase':
+                total = phases.setdefault(event['name'], [0, 0, 0])
+                total[0] += 1
+                total[1] += event['dur']
+                total[2] += event['args']['cpu_ms']
+
+        print(f'\n{"phase":<24} {"count":>6} {"wall ms":>10} {"cpu ms":>10}')
+        for name, (calls, wall, cpu) in sorted(phases.items(), key=lambda p: -p[1][1]):
+            print(f'{name:<24} {calls:>6} {wall / 1000:>10.1f} {cpu:>10.1f}')
+
+        notebooks = [event for event in self.events if event['cat'] == 'notebook']
+        for title, key in (
+            ('slowest notebooks', lambda e: -e['dur']),
+            ('largest notebooks', lambda e: -e['args']['memory_peak_kb'])
+        ):
+            print(f'\n{title:<48} {"wall ms":>10} {"cpu ms":>10} {"peak kB":>10} {"size kB":>10}')
+            for event in sorted(notebooks, key=key)[:count]:
+                args = event['args']
+                print(
+                    f'{event["name"][-48:]:<48} {event["dur"] / 1000:>10.1f} '
+                    f'{args["cpu_ms"]:>10.1f} {args["memory_peak_kb"]:>10.1f} '
+                    f'{args.get("size", 0) / 1024:>10.1f}'
+                )
+
+
+def reset_peak():
+    # tracemalloc.reset_peak is new in Python 3.9, peaks are not reset before
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+
+def start_trace():
+    """Start tracing the conversion phases of this process
+    """
+    global _tracer
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop_trace():
+    """Stop tracing and return the tracer
+    """
+    global _tracer
+    tracer = _tracer
+    _tracer = None
+    tracemalloc.stop()
+    return tracer
+
+
+def is_tracing():
+    return _tracer is not None
+
+
+def add_events(events):
+    """Add events recorded in another process
+    """
+    if _tracer is not None:
+        _tracer.events += events
+
+
+@contextmanager
+def span(name, category='phase', **args):
+    """Record the enclosed phase when tracing, `args` are added to the event
+    """
+    if _tracer is None:
+        yield args
+    else:
+        with _tracer.span(name, category, **args) as span_args:
+            yield span_args
+
+
+def run_traced(func, *args, **kwargs):
+    """Call func while tracing, return its result and the recorded events
+
+    Used in worker processes, the events are added to the trace of the main
+    process with `add_events`.
+    """
+    start_trace()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        tracer = stop_trace()
+    return result, tracer.events
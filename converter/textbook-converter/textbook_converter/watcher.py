@@ -0,0 +1,217 @@
+import os
+import shutil
+import time
+
+from pathlib import Path
+
+from .accumulator import ResourceAccumulator
+from .cache import BuildCache
+from .converter import (
+    convert_toc,
+    export_notebook_file,
+    get_standalone_dir,
+    merge,
+    standalone,
+    write_notebook_resources
+)
+from .manifest import write_manifest
+from .toc import Toc
+from .writer import count_changes, record_outputs
+
+
+class TocWatcher:
+    """Convert all sections in toc yaml, then reconvert sections as their notebook changes
+
+    Only the changed section is converted again, and only its chapter is
+    merged again (or the section made standalone again for problem sets).
+    The shared glossary and notations are updated with the contributions of
+    the changed notebook. A change to the toc yaml converts everything again.
+    `shared_dir` is copied to the output for notebooks without a `shared/`
+    directory, and `executor`, `copy_assets`, `prune` and `on_progress` are
+    used when converting everything, see `convert_toc`. `on_progress` is
+    also called after each section converted again.
+    """
+
+    def __init__(
+        self,
+        toc_file_path,
+        notebooks_dir=None,
+        output_dir=None,
+        jobs=1,
+        cache_dir=None,
+        options=None,
+        shared_dir=None,
+        executor=None,
+        copy_assets=False,
+        prune=False,
+        on_progress=None
+    ):
+        self.toc_file_path = str(Path(toc_file_path).resolve())
+        self.nb_dir_path = Path(toc_file_path).parent if notebooks_dir is None else Path(notebooks_dir)
+        self.output_path = output_dir or str(self.nb_dir_path)
+        self.shared_dir = os.path.join(self.output_path, 'shared')
+        self.jobs = jobs
+        self.cache_dir = cache_dir
+        self.options = options
+        self.notebooks_shared_dir = shared_dir
+        self.executor = executor
+        self.copy_assets = copy_assets
+        self.prune = prune
+        self.on_progress = on_progress
+        self.accumulator = None
+        self.toc = None
+        self.sections = {}
+        self.mtimes = {}
+
+    def load_toc(self):
+        """Map each notebook in the toc to its section
+        """
+        self.toc = Toc.load(self.toc_file_path)
+        self.sections = {}
+        for chapter in self.toc.chapters:
+            chapter_output = chapter.get_output_dir(self.output_path)
+
+            for section in chapter.sections:
+                section_url = section['url'][1:] if section['url'].startswith('/') else section['url']
+                nb_file_path = str(Path(os.path.join(self.nb_dir_path, section_url) + '.ipynb').resolve())
+                self.sections[nb_file_path] = (section, chapter_output, chapter.is_problem_set)
+
+    def get_mtimes(self):
+        mtimes = {}
+        for file_path in [self.toc_file_path, *self.sections.keys()]:
+            try:
+                stat = os.stat(file_path)
+                mtimes[file_path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                mtimes[file_path] = None
+        return mtimes
+
+    def build(self):
+        """Convert all sections, return the number of sections converted, cached and failed
+        """
+        self.load_toc()
+        self.accumulator = ResourceAccumulator()
+        summary = convert_toc(
+            self.toc,
+            notebooks_dir=str(self.nb_dir_path),
+            output_dir=self.output_path,
+            jobs=self.jobs,
+            cache_dir=self.cache_dir,
+            options=self.options,
+            accumulator=self.accumulator,
+            shared_dir=self.notebooks_shared_dir,
+            executor=self.executor,
+            copy_assets=self.copy_assets,
+            prune=self.prune,
+            on_progress=self.on_progress
+        )
+        self.mtimes = self.get_mtimes()
+        return summary
+
+    def update(self, nb_file_path):
+        """Convert the section of the notebook again and update its chapter
+
+        Returns False if the section could not be converted.
+        """
+        section = self.sections[nb_file_path][0]
+        start = time.perf_counter()
+        with record_outputs() as outputs:
+            updated = self.convert_section(nb_file_path)
+            if updated:
+                write_manifest(self.toc, self.nb_dir_path, self.output_path)
+        if updated:
+            changed, _ = count_changes(outputs)
+            print(f'updated {section["id"]} in {time.perf_counter() - start:.2f}s, {changed} files changed')
+        if self.on_progress:
+            self.on_progress({
+                'event': 'section',
+                'section': section['id'],
+                'notebook': nb_file_path,
+                'cached': False,
+                'converted': updated
+            })
+        return updated
+
+    def convert_section(self, nb_file_path):
+        """Convert the section of the notebook, return False if it could not be converted
+        """
+        section, chapter_output, is_problem_set = self.sections[nb_file_path]
+        section_output = (
+            get_standalone_dir(chapter_output, section) if is_problem_set else chapter_output
+        )
+
+        if is_problem_set:
+            # start over from the files of this section only
+            shutil.rmtree(section_output, ignore_errors=True)
+            for file_name in ('index.yaml', 'functions.ts'):
+                self.accumulator.discard(os.path.join(section_output, file_name))
+
+        resources = export_notebook_file(
+            nb_file_path,
+            output_dir=section_output,
+            section_id=section['id'],
+            is_problem_set=is_problem_set,
+            options=self.options
+        )
+        if not resources:
+            return False
+
+        if self.cache_dir:
+            cache = BuildCache(self.cache_dir)
+            section_hash = cache.section_hash(nb_file_path, section['id'], is_problem_set, self.options)
+            cache.store(nb_file_path, section_hash, section_output, resources)
+            cache.save()
+
+        write_notebook_resources(
+            resources,
+            nb_file_path,
+            output_dir=section_output,
+            shared_dir=self.shared_dir,
+            accumulator=self.accumulator
+        )
+        for file_path in [
+            os.path.join(self.shared_dir, 'glossary.yaml'),
+            os.path.join(self.shared_dir, 'notations.yaml'),
+            os.path.join(section_output, 'index.yaml'),
+            os.path.join(section_output, 'functions.ts')
+        ]:
+            self.accumulator.write(file_path)
+
+        if is_problem_set:
+            standalone(chapter_output, section)
+        else:
+            merge(chapter_output, self.toc)
+        return True
+
+    def poll(self):
+        """Convert the sections whose notebook changed since the last poll
+
+        Returns the number of sections converted, cached and failed, like `build`.
+        """
+        mtimes = self.get_mtimes()
+        changed = [
+            file_path for file_path, mtime in mtimes.items()
+            if mtime is not None and mtime != self.mtimes.get(file_path)
+        ]
+        self.mtimes = mtimes
+
+        if self.toc_file_path in changed:
+            print(f'{self.toc_file_path} changed, converting all sections')
+            return self.build()
+
+        summary = {'converted': 0, 'cached': 0, 'failed': 0}
+        for nb_file_path in changed:
+            summary['converted' if self.update(nb_file_path) else 'failed'] += 1
+        return summary
+
+    def watch(self, interval=0.5):
+        """Build, then poll the notebooks for changes until interrupted
+        """
+        self.build()
+        print(f'watching {len(self.sections)} notebooks in {self.nb_dir_path}')
+        try:
+            while True:
+                time.sleep(interval)
+                self.poll()
+        except KeyboardInterrupt:
+            pass
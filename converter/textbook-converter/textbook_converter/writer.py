@@ -0,0 +1,124 @@
+import os
+import shutil
+
+from contextlib import contextmanager
+from pathlib import Path
+
+
+# output files of the current run and whether they changed, while recording
+_outputs = None
+
+
+def record_output(file_path, changed):
+    if _outputs is not None:
+        path = str(Path(file_path).resolve())
+        _outputs[path] = _outputs.get(path, False) or changed
+
+
+@contextmanager
+def record_outputs():
+    """Record the output files written while in the context
+
+    Yields a dictionary of the file paths, and whether each file changed.
+    Files written in other processes must be added with `record_output`.
+    """
+    global _outputs
+    previous = _outputs
+    _outputs = {}
+    try:
+        yield _outputs
+    finally:
+        outputs = _outputs
+        _outputs = previous
+        if previous is not None:
+            for path, changed in outputs.items():
+                record_output(path, changed)
+
+
+def is_same_file_content(file_path, other_file_path):
+    """Return True if both files exist and have the same content
+    """
+    if not os.path.isfile(file_path) or not os.path.isfile(other_file_path):
+        return False
+    if os.path.getsize(file_path) != os.path.getsize(other_file_path):
+        return False
+    with open(file_path, 'rb') as file, open(other_file_path, 'rb') as other_file:
+        while True:
+            chunk = file.read(1024 * 1024)
+            if chunk != other_file.read(1024 * 1024):
+                return False
+            if not chunk:
+                return True
+
+
+def count_changes(outputs):
+    """Return the number of changed and unchanged files in the recorded outputs
+
+    Files that no longer exist (e.g. moved) are not counted.
+    """
+    outputs = {path: changed for path, changed in outputs.items() if os.path.isfile(path)}
+    changed = sum(1 for is_changed in outputs.values() if is_changed)
+    return changed, len(outputs) - changed
+
+
+def replace_if_changed(tmp_file_path, file_path):
+    """Move the temporary file to file path, unless the file has the same content
+
+    Unchanged files keep their modification time, so downstream builds can
+    skip them. Returns True if the file changed.
+    """
+    if is_same_file_content(tmp_file_path, file_path):
+        os.remove(tmp_file_path)
+        changed = False
+    else:
+        os.replace(tmp_file_path, file_path)
+        changed = True
+    record_output(file_path, changed)
+    return changed
+
+
+def write_stream(file_path, fragments):
+    """Write text fragments to the file as they are generated, if the content changed
+
+    Returns True if the file changed. Nothing is written if generating the
+    fragments fails.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    tmp_file_path = f'{file_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_file_path, 'w', encoding='utf-8') as tmp_file:
+            for fragment in fragments:
+                tmp_file.write(fragment)
+    except Exception:
+        if os.path.exists(tmp_file_path):
+            os.remove(tmp_file_path)
+        raise
+    return replace_if_changed(tmp_file_path, file_path)
+
+
+def write_text(file_path, text):
+    """Write the text to the file if its content changed, return True if it did
+    """
+    return write_stream(file_path, [text])
+
+
+def copy_file(src_file_path, file_path):
+    """Copy the file if the content changed, return True if it did
+    """
+    if is_same_file_content(src_file_path, file_path):
+        record_output(file_path, False)
+        return False
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    tmp_file_path = f'{file_path}.{os.getpid()}.tmp'
+    shutil.copyfile(src_file_path, tmp_file_path)
+    os.replace(tmp_file_path, file_path)
+    record_output(file_path, True)
+    return True
+
+
+def move_file(src_file_path, file_path):
+    """Move the file, keeping the destination file as is if the content is the same
+
+    Returns True if the destination file changed.
+    """
+    return replace_if_changed(src_file_path, file_path)
@@ -1,3 +1,64 @@
 // =============================================================================
 // Shared Scripts
 // =============================================================================
+
+import { Step } from '@mathigon/studio'
+
+// A goal of a step, scored when the element matching `selector` is clicked
+// (`click`) or gets the expected value (`value`, `checked` for checkboxes)
+interface GoalEvent {
+  selector: string
+  event: 'click' | 'value'
+  value?: string
+  goal: string
+}
+
+// Step function (see `export const <id>` in functions.ts) scoring the goals
+// of the step, from the goal events generated by the converter
+export const handleGoals = (events: GoalEvent[]) => ($section: Step) => {
+  setTimeout(() => {
+    for (const { selector, event, value, goal } of events) {
+      const elt = $section.$(selector) as any
+      if (!elt) { continue }
+
+      if (event === 'click') {
+        elt.on('click', () => {
+          $section.score(goal)
+        })
+      } else {
+        elt.on('change keyup input paste', (e: Event) => {
+          if (elt.value === value || (value === 'checked' && elt.checked)) {
+            e.preventDefault()
+            $section.score(goal)
+          }
+        })
+      }
+    }
+  }, 250)
+}
+
+// Large code cell outputs are written to separate files by the converter
+// (`--split-outputs`), and loaded the first time their `details` is opened.
+const loadLazyOutput = (details: HTMLDetailsElement) => {
+  const pre = details.querySelector('pre')
+  if (!pre || details.dataset.loaded) { return }
+  details.dataset.loaded = 'true'
+
+  fetch(details.dataset.src || '').then((res) => {
+    if (!res.ok) { throw new Error(res.statusText) }
+    return res.text()
+  }).then((text) => {
+    pre.textContent = text
+  }).catch(() => {
+    pre.textContent = 'The output could not be loaded.'
+    delete details.dataset.loaded
+  })
+}
+
+// `toggle` does not bubble, so it is listened to in the capture phase
+document.addEventListener('toggle', (event) => {
+  const details = event.target as HTMLDetailsElement
+  if (details.open && details.classList?.contains('lazy-output')) {
+    loadLazyOutput(details)
+  }
+}, true)